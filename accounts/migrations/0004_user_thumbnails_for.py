@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_user_courses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='thumbnails_for',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 # Create your models here.
 
 from courses.utils import user_index_generator
+from courses.thumbnails import ThumbnailsMixin, THUMBNAIL_SIZES, delete_thumbnails
+from accounts import tasks
 # from courses.models import Course
 
 
@@ -73,7 +75,7 @@ class UserManager(BaseUserManager):
         return self.get_queryset().active()
 
 
-class User(AbstractBaseUser):
+class User(ThumbnailsMixin, AbstractBaseUser):
     user_index = models.CharField(max_length=100, blank=True, null=True)
     email = models.EmailField(max_length=255, unique=True)
     full_name = models.CharField(max_length=255, blank=True, null=True)
@@ -90,6 +92,8 @@ class User(AbstractBaseUser):
     # class
     USERNAME_FIELD = 'email'
 
+    thumbnail_field = 'photo'
+
     REQUIRED_FIELDS = []
 
     objects = UserManager()
@@ -114,6 +118,21 @@ class User(AbstractBaseUser):
     def has_module_perms(self, app_label):
         return True
 
+    def get_photo_url(self, size='medium', fmt='jpeg'):
+        """The thumbnail of the photo once it is made, the photo until then."""
+        if not self.photo:
+            return None
+        if fmt in self.get_thumbnail_formats():
+            return self.photo.storage.url(self.get_thumbnail_name(size, fmt))
+        return self.photo.url
+
+    @property
+    def photo_thumbnails(self):
+        formats = self.get_thumbnail_formats()
+        if not formats:
+            return {}
+        return {size: {fmt: self.get_photo_url(size, fmt) for fmt in formats} for size in THUMBNAIL_SIZES}
+
     @property
     def is_teacher(self):
         return self.teacher
@@ -131,7 +150,8 @@ class User(AbstractBaseUser):
         return self.active
 
 
-from django.db.models.signals import pre_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 
 
 def pre_save_user_receiver(sender, instance, *args, **kwargs):
@@ -140,3 +160,18 @@ def pre_save_user_receiver(sender, instance, *args, **kwargs):
 
 
 pre_save.connect(pre_save_user_receiver, sender=User)
+
+
+def user_photo_post_save_receiver(sender, instance, *args, **kwargs):
+    if instance.thumbnails_outdated():
+        user_id = instance.pk
+        transaction.on_commit(lambda: tasks.generate_photo_thumbnails.delay(user_id))
+
+
+def user_photo_post_delete_receiver(sender, instance, *args, **kwargs):
+    if instance.thumbnails_for:
+        delete_thumbnails(instance.photo.storage, instance.thumbnails_for)
+
+
+post_save.connect(user_photo_post_save_receiver, sender=User)
+post_delete.connect(user_photo_post_delete_receiver, sender=User)
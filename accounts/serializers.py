@@ -7,7 +7,7 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id','user_index', 'full_name', 'email', "is_teacher",
-                  'is_staff', 'is_admin']
+                  'is_staff', 'is_admin', 'photo_thumbnails']
 
 
 class SnippetUserSerializer(serializers.ModelSerializer):
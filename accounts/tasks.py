@@ -0,0 +1,9 @@
+from celery import shared_task
+
+
+@shared_task
+def generate_photo_thumbnails(user_id):
+    from accounts.models import User
+    user = User.objects.filter(id=user_id).first()
+    if user is not None and user.thumbnails_outdated():
+        user.update_thumbnails()
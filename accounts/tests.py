@@ -1,3 +1,67 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from courses.thumbnails import THUMBNAIL_SIZES, get_thumbnail_names
+from .models import User
+
+
+class PhotoThumbnailsTests(TestCase):
+    # on_commit callbacks never run here, thumbnails are made by calling
+    # what the task would call
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('student@example.com', password='secret')
+
+    def set_photo(self, color):
+        buffer = BytesIO()
+        PILImage.new('RGB', (800, 600), color).save(buffer, 'PNG')
+        self.user.photo = ContentFile(buffer.getvalue(), 'photo.png')
+        self.user.save()
+        self.user.update_thumbnails()
+        return self.user.photo.name
+
+    def existing_thumbnails(self, name):
+        storage = self.user.photo.storage
+        return [thumbnail for thumbnail in get_thumbnail_names(name) if storage.exists(thumbnail)]
+
+    def test_formats_written_by_the_worker(self):
+        with mock.patch('courses.thumbnails.get_available_formats', return_value=['jpeg']):
+            self.set_photo((200, 30, 30))
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.thumbnail_formats, 'jpeg')
+        self.assertEqual(set(user.photo_thumbnails), set(THUMBNAIL_SIZES))
+        for size, urls in user.photo_thumbnails.items():
+            self.assertEqual(list(urls), ['jpeg'])
+            self.assertTrue(urls['jpeg'].endswith(f'_{size}.jpeg'))
+
+    def test_no_thumbnails_before_the_worker_ran(self):
+        self.set_photo((200, 30, 30))
+        self.user.photo = ContentFile(b'new', 'other.png')
+        self.assertEqual(self.user.photo_thumbnails, {})
+        self.assertEqual(self.user.get_photo_url(), self.user.photo.url)
+
+    def test_replaced_photo_drops_old_thumbnails(self):
+        first = self.set_photo((200, 30, 30))
+        second = self.set_photo((30, 30, 200))
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.existing_thumbnails(first), [])
+        self.assertTrue(self.existing_thumbnails(second))
+
+    def test_deleted_user_drops_thumbnails(self):
+        name = self.set_photo((200, 30, 30))
+        self.assertTrue(self.existing_thumbnails(name))
+
+        User.objects.get(pk=self.user.pk).delete()
+        self.assertEqual(self.existing_thumbnails(name), [])
@@ -0,0 +1,12 @@
+from django.urls import path, include
+from rest_framework import routers
+
+from .views import EventViewSet, FreeBusyAPIView
+
+router = routers.DefaultRouter()
+router.register('events', EventViewSet, 'events')
+
+urlpatterns = [
+    path('freebusy/', FreeBusyAPIView.as_view(), name='freebusy'),
+    path('', include(router.urls))
+]
@@ -0,0 +1,130 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+
+from rest_framework import viewsets
+from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+
+from ..models import Event, Participation
+from ..serializers import EventSerializer, InviteSerializer, RsvpSerializer, FreeBusySerializer
+from ..utils import merge_intervals
+
+from accounts.permissions import IsOwner
+
+User = get_user_model()
+
+
+class EventViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Events of calendars visible to the user, annotated with guest counts.
+    List accepts optional start and end dates (YYYY-MM-DD).
+    """
+    serializer_class = EventSerializer
+    batch_size = 1000
+
+    def get_permissions(self):
+        permission_classes = [permissions.IsAuthenticated]
+        if self.action == 'invite':
+            permission_classes.append(IsOwner)
+        return [permission() for permission in permission_classes]
+
+    def get_serializer_class(self):
+        if self.action == 'invite':
+            return InviteSerializer
+        if self.action == 'rsvp':
+            return RsvpSerializer
+        return EventSerializer
+
+    def get_date_arg(self, name):
+        try:
+            return datetime.date.fromisoformat(self.request.query_params.get(name, ''))
+        except ValueError:
+            return None
+
+    def get_queryset(self):
+        qs = Event.objects.available(self.request)
+        if self.action == 'list':
+            start, end = self.get_date_arg('start'), self.get_date_arg('end')
+            if start and end:
+                qs = qs.between(start, end)
+        return qs.with_guest_counts().order_by('date', 'start', 'id')
+
+    @action(detail=True, methods=['post'])
+    def invite(self, request, pk=None):
+        """Invite the participants of a course and/or a list of users."""
+        event = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user_ids = set(serializer.validated_data.get('users', ()))
+        course = serializer.validated_data.get('course')
+        if course is not None:
+            user_ids.update(course.participants.values_list('id', flat=True))
+        user_ids.discard(event.owner_id)
+
+        # users already invited keep their answer
+        Participation.objects.bulk_create(
+            [Participation(event=event, user_id=user_id) for user_id in user_ids],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        guests = Participation.objects.filter(event=event).count()
+        return Response({'guests': guests}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def rsvp(self, request):
+        """Answer invitations to many events at once."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        answers = {r['event']: r['status'] for r in serializer.validated_data['responses']}
+
+        participations = list(Participation.objects.filter(user=request.user, event_id__in=answers))
+        for participation in participations:
+            participation.status = answers[participation.event_id]
+        Participation.objects.bulk_update(participations, ['status'], batch_size=self.batch_size)
+
+        updated = [participation.event_id for participation in participations]
+        return Response({
+            'updated': updated,
+            'not_invited': sorted(set(answers) - set(updated))
+        }, status=status.HTTP_200_OK)
+
+
+class FreeBusyAPIView(APIView):
+    """
+    Busy intervals of users from start to end, e.g.
+    ?users=1&users=2&start=2021-06-01&end=2021-06-30. Users may look up
+    themselves, teachers, staff and admins anyone.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        serializer = FreeBusySerializer(data={
+            'users': request.query_params.getlist('users'),
+            'start': request.query_params.get('start'),
+            'end': request.query_params.get('end')
+        })
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        user = request.user
+        user_ids = set(data['users'])
+        if user_ids != {user.pk} and not (user.is_teacher or user.is_staff or user.is_admin):
+            raise PermissionDenied("You can only see your own free/busy information")
+
+        users = User.objects.filter(pk__in=user_ids).only('id')
+        busy = Event.objects.free_busy(users, data['start'], data['end'])
+        return Response({
+            'start': data['start'],
+            'end': data['end'],
+            'busy': merge_intervals(i for intervals in busy.values() for i in intervals),
+            'users': [
+                {'user': user_id, 'busy': intervals}
+                for user_id, intervals in sorted(busy.items())
+            ]
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,37 @@
+import os
+
+from django import forms
+
+from .models import REPEAT_CHOICES
+
+IMPORT_EXTENSIONS = ['.csv', '.ics']
+
+
+class EventImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or iCalendar (.ics) file")
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        extension = os.path.splitext(file.name)[1].lower()
+        if extension not in IMPORT_EXTENSIONS:
+            raise forms.ValidationError("Only CSV and iCalendar (.ics) files can be imported")
+        return file
+
+
+class EventRowForm(forms.Form):
+    """
+    Fields of a single imported event. Importers clean rows with
+    base_fields directly, as building a form per row is too slow for
+    large files.
+    """
+    name = forms.CharField(max_length=200)
+    body = forms.CharField(required=False)
+    color = forms.CharField(max_length=7, required=False)
+    date = forms.DateField()
+    start = forms.TimeField(required=False)
+    end = forms.TimeField(required=False)
+    whole_day = forms.BooleanField(required=False)
+    place = forms.CharField(max_length=200, required=False)
+    repeat = forms.ChoiceField(choices=REPEAT_CHOICES, required=False)
+    repeat_interval = forms.IntegerField(min_value=1, required=False)
+    repeat_until = forms.DateField(required=False)
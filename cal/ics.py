@@ -0,0 +1,201 @@
+import datetime
+
+from django.utils import timezone
+
+LINE_LIMIT = 75  # octets, RFC 5545 3.1
+
+ICS_FREQUENCIES = {
+    'daily': 'DAILY',
+    'weekly': 'WEEKLY',
+    'monthly': 'MONTHLY',
+    'yearly': 'YEARLY'
+}
+
+
+def escape(text):
+    return (text or '')\
+        .replace('\\', '\\\\')\
+        .replace(';', '\\;')\
+        .replace(',', '\\,')\
+        .replace('\r\n', '\\n')\
+        .replace('\n', '\\n')
+
+
+def fold(line):
+    """Split a content line into CRLF terminated chunks of at most 75 octets."""
+    data = line.encode('utf-8')
+    if len(data) <= LINE_LIMIT:
+        return line + '\r\n'
+
+    chunks = []
+    limit = LINE_LIMIT
+    while data:
+        cut = min(limit, len(data))
+        # never split a multi-byte character
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+        limit = LINE_LIMIT - 1  # continuation lines start with a space
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def format_date(date):
+    return date.strftime('%Y%m%d')
+
+
+def format_datetime(date, time):
+    return datetime.datetime.combine(date, time).strftime('%Y%m%dT%H%M%S')
+
+
+def format_utc(value):
+    if timezone.is_aware(value):
+        value = value.astimezone(datetime.timezone.utc)
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_lines(event, domain):
+    yield 'BEGIN:VEVENT'
+    yield f'UID:event-{event.pk}@{domain}'
+    yield f'DTSTAMP:{format_utc(event.updated)}'
+    yield f'LAST-MODIFIED:{format_utc(event.updated)}'
+
+    whole_day = event.whole_day or event.start is None
+    if whole_day:
+        yield f'DTSTART;VALUE=DATE:{format_date(event.date)}'
+        yield f'DTEND;VALUE=DATE:{format_date(event.date + datetime.timedelta(days=1))}'
+    else:
+        # events have no timezone yet, so times are floating
+        yield f'DTSTART:{format_datetime(event.date, event.start)}'
+        if event.end is not None and event.end >= event.start:
+            yield f'DTEND:{format_datetime(event.date, event.end)}'
+
+    if event.repeat in ICS_FREQUENCIES:
+        rule = f'RRULE:FREQ={ICS_FREQUENCIES[event.repeat]};INTERVAL={event.repeat_interval or 1}'
+        if event.repeat_until:
+            if whole_day:
+                rule += f';UNTIL={format_date(event.repeat_until)}'
+            else:
+                rule += f';UNTIL={format_datetime(event.repeat_until, datetime.time.max)}'
+        yield rule
+
+    yield f'SUMMARY:{escape(event.name)}'
+    if event.body:
+        yield f'DESCRIPTION:{escape(event.body)}'
+    if event.place:
+        yield f'LOCATION:{escape(event.place)}'
+    yield 'END:VEVENT'
+
+
+def iter_calendar(calendar, events, domain):
+    """
+    Yield an iCalendar document chunk by chunk, one chunk per event, so a
+    calendar of any size is written without building it in memory.
+    """
+    yield ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{domain}//Calendar//EN',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape(calendar.name)}',
+    ))
+    for event in events:
+        yield ''.join(fold(line) for line in event_lines(event, domain))
+    yield fold('END:VCALENDAR')
+
+
+def unescape(text):
+    result = []
+    chars = iter(text)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            result.append('\n' if char in 'nN' else char)
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def unfold(lines):
+    """Join folded content lines back together, reading the input lazily."""
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line):
+    """Split 'NAME;PARAM=VALUE:value' into (name, params, value)."""
+    head, _, value = line.partition(':')
+    name, *params = head.split(';')
+    params = dict(param.partition('=')[::2] for param in params)
+    return name.upper(), {k.upper(): v for k, v in params.items()}, value
+
+
+def parse_datetime(value, params):
+    """Return (date, time); time is None for DATE values."""
+    if params.get('VALUE') == 'DATE' or 'T' not in value:
+        return datetime.datetime.strptime(value[:8], '%Y%m%d').date(), None
+
+    dt = datetime.datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        dt = timezone.localtime(dt.replace(tzinfo=datetime.timezone.utc))
+    return dt.date(), dt.time()
+
+
+def parse_rule(value, row):
+    rule = dict(part.partition('=')[::2] for part in value.split(';'))
+    frequencies = {v: k for k, v in ICS_FREQUENCIES.items()}
+    row['repeat'] = frequencies.get(rule.get('FREQ'), 'none')
+    row['repeat_interval'] = rule.get('INTERVAL') or 1
+    if rule.get('UNTIL'):
+        row['repeat_until'] = parse_datetime(rule['UNTIL'], {})[0]
+
+
+def parse_events(lines):
+    """
+    Yield one dict per VEVENT of an iCalendar stream, with keys matching
+    Event fields plus 'guests' (a list of attendee emails).
+    """
+    row = None
+    for line in unfold(lines):
+        name, params, value = parse_line(line)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            row = {'guests': [], 'whole_day': False}
+        elif row is None:
+            continue
+        elif name == 'END' and value.upper() == 'VEVENT':
+            yield row
+            row = None
+        elif name == 'SUMMARY':
+            row['name'] = unescape(value)
+        elif name == 'DESCRIPTION':
+            row['body'] = unescape(value)
+        elif name == 'LOCATION':
+            row['place'] = unescape(value)
+        elif name == 'DTSTART':
+            try:
+                row['date'], row['start'] = parse_datetime(value, params)
+                row['whole_day'] = row['start'] is None
+            except ValueError:
+                # left for row validation to report
+                row['date'] = value
+        elif name == 'DTEND':
+            try:
+                row['end'] = parse_datetime(value, params)[1]
+            except ValueError:
+                row['end'] = value
+        elif name == 'RRULE':
+            try:
+                parse_rule(value, row)
+            except ValueError:
+                row['repeat_until'] = value
+        elif name == 'ATTENDEE' and value.lower().startswith('mailto:'):
+            row['guests'].append(value[len('mailto:'):])
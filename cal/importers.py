@@ -0,0 +1,130 @@
+import csv
+import io
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.forms.utils import ErrorDict, ErrorList
+
+from . import ics
+from .forms import EventRowForm
+from .models import Event, Participation, touch_calendars
+from .utils import bump_calendar_version
+
+User = get_user_model()
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, errors))
+
+
+def read_csv(text):
+    for row in csv.DictReader(text):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+        guests = row.get('guests') or ''
+        row['guests'] = guests.replace(';', ' ').replace(',', ' ').split()
+        yield row
+
+
+def read_rows(file, filename):
+    """
+    Lazily read event rows from a binary CSV or iCalendar file. A file that
+    is not UTF-8 text or not valid CSV raises ValidationError while it is
+    being read.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    rows = ics.parse_events(text) if filename.lower().endswith('.ics') else read_csv(text)
+    try:
+        yield from rows
+    except UnicodeDecodeError:
+        raise ValidationError("The file must be UTF-8 encoded text")
+    except csv.Error as e:
+        raise ValidationError("The file is not a valid CSV file: %(error)s", params={'error': e})
+
+
+def clean_row(row):
+    """Return (data, errors) for a row, validated with EventRowForm fields."""
+    data = {}
+    errors = ErrorDict()
+    for name, field in EventRowForm.base_fields.items():
+        try:
+            data[name] = field.clean(row.get(name))
+        except ValidationError as e:
+            errors[name] = ErrorList(e.messages)
+    data['repeat'] = data.get('repeat') or 'none'
+    data['repeat_interval'] = data.get('repeat_interval') or 1
+    return data, errors
+
+
+def get_guest_ids(emails):
+    emails = {email.lower() for email in emails}
+    if not emails:
+        return {}
+    users = User.objects\
+        .annotate(email_lower=Lower('email'))\
+        .filter(email_lower__in=emails)\
+        .values_list('email_lower', 'id')
+    return dict(users)
+
+
+def import_events(calendar, owner, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate rows and insert them into the calendar batch by batch, with one
+    bulk insert of events and one of guest participations per batch.
+    Invalid rows are skipped and reported with their row number.
+    """
+    result = ImportResult()
+    rows = enumerate(rows, start=1)
+
+    with transaction.atomic():
+        # bulk_create bypasses order_with_respect_to, so continue it by hand
+        order = Event.objects.filter(calendar=calendar).count()
+
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+
+            events = []
+            guests = []
+            for row_number, row in batch:
+                # one participation per guest, however the email is cased
+                emails = {email.lower() for email in row.pop('guests', [])}
+                data, errors = clean_row(row)
+                if errors:
+                    result.add_error(row_number, errors)
+                    continue
+
+                data['color'] = data['color'] or calendar.color
+                events.append(Event(calendar=calendar, owner=owner, _order=order, **data))
+                guests.append(emails)
+                order += 1
+
+            Event.objects.bulk_create(events)
+            result.created += len(events)
+
+            guest_ids = get_guest_ids(itertools.chain.from_iterable(guests))
+            Participation.objects.bulk_create([
+                Participation(event=event, user_id=guest_ids[email])
+                for event, emails in zip(events, guests)
+                for email in emails
+                if email in guest_ids
+            ])
+
+    if result.created:
+        bump_calendar_version(calendar.pk)
+        touch_calendars([calendar.pk])
+    return result
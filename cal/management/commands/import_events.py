@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+
+from cal.models import Calendar
+from cal.importers import import_events, read_rows, IMPORT_BATCH_SIZE
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Import events from a CSV or iCalendar (.ics) file into a calendar"
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendar_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--owner', help="Email of the events owner, the calendar owner by default")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            calendar = Calendar.objects.get(pk=options['calendar_id'])
+        except Calendar.DoesNotExist:
+            raise CommandError("Calendar %s does not exist" % options['calendar_id'])
+
+        owner = calendar.owner
+        if options['owner']:
+            try:
+                owner = User.objects.get(email=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError("User %s does not exist" % options['owner'])
+
+        with open(options['path'], 'rb') as f:
+            rows = read_rows(f, options['path'])
+            try:
+                result = import_events(calendar, owner, rows, batch_size=options['batch_size'])
+            except ValidationError as e:
+                raise CommandError(' '.join(e.messages))
+
+        for row_number, errors in result.errors:
+            self.stderr.write("Row %s: %s" % (row_number, errors.as_text()))
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %s events, %s rows skipped" % (result.created, result.failed)
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cal', '0010_auto_20200821_1740'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['calendar', 'date'], name='cal_event_calenda_306b10_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:46
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cal', '0011_auto_20261018_1444'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='repeat',
+            field=models.CharField(choices=[('none', 'Does not repeat'), ('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='repeat_interval',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='repeat_until',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(_negated=True, repeat='none'), fields=['calendar', 'date'], name='cal_event_series_idx'),
+        ),
+    ]
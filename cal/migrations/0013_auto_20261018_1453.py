@@ -0,0 +1,33 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:53
+
+import secrets
+
+from django.db import migrations, models
+
+
+def replace_duplicate_tokens(apps, schema_editor):
+    CalendarShareToken = apps.get_model('cal', 'CalendarShareToken')
+    seen = set()
+    for share_token in CalendarShareToken.objects.order_by('pk'):
+        if share_token.token and share_token.token not in seen:
+            seen.add(share_token.token)
+            continue
+        share_token.token = secrets.token_urlsafe(24)
+        share_token.save(update_fields=['token'])
+        seen.add(share_token.token)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cal', '0012_auto_20261018_1446'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_duplicate_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='calendarsharetoken',
+            name='token',
+            field=models.CharField(blank=True, max_length=50, unique=True),
+        ),
+    ]
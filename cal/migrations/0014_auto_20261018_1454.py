@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:54
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Min
+
+
+def remove_duplicate_participations(apps, schema_editor):
+    Participation = apps.get_model('cal', 'Participation')
+    keep = Participation.objects.values('event', 'user').annotate(first=Min('id')).values('first')
+    Participation.objects.exclude(pk__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cal', '0013_auto_20261018_1453'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_participations, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='participation',
+            unique_together={('event', 'user')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cal', '0014_auto_20261018_1454'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendar',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,10 +1,28 @@
-from django.db import models
-from django.db.models import Q
-from django.db.models.signals import pre_save
+import datetime
+
+from dateutil import rrule
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, Count
+from django.core.validators import MinValueValidator
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-
-from .utils import token_generator
+from django.utils import timezone
+
+from .utils import (
+    share_token_generator,
+    bump_calendar_version,
+    visible_calendars_key,
+    invalidate_visible_calendars,
+    expand_occurrences,
+    occurrence_interval,
+    merge_intervals,
+    calendar_fragment_key,
+    Occurrence,
+    CALENDAR_CACHE_TIMEOUT,
+    VISIBLE_CALENDARS_TIMEOUT
+)
 
 User = get_user_model()
 
@@ -22,7 +40,7 @@ class CalendarQuerySet(models.QuerySet):
 
     def available(self, request):
         if request.user.is_authenticated:
-            return self.filter(Q(owner=request.user) | Q(subscribers__exact=request.user))
+            return self.filter(pk__in=Calendar.objects.visible_ids(request.user))
         return self.none()
 
 
@@ -33,6 +51,50 @@ class CalendarManager(models.Manager):
     def available(self, request):
         return self.get_queryset().available(request)
 
+    def visible_ids(self, user):
+        """
+        Ids of calendars the user owns or subscribes to, cached per user for
+        VISIBLE_CALENDARS_TIMEOUT and invalidated when subscriptions or
+        calendar owners change.
+        """
+        key = visible_calendars_key(user.pk)
+        ids = cache.get(key)
+        if ids is None:
+            owned = self.filter(owner=user).order_by().values_list('id', flat=True)
+            subscribed = Calendar.subscribers.through.objects\
+                .filter(user=user)\
+                .order_by()\
+                .values_list('calendar_id', flat=True)
+            ids = sorted(owned.union(subscribed))
+            cache.set(key, ids, VISIBLE_CALENDARS_TIMEOUT)
+        return ids
+
+    def visible_ids_for(self, users):
+        """
+        visible_ids() of several users, keyed by user id. Cached lists are
+        reused, the rest are read with a single query and cached.
+        """
+        keys = {visible_calendars_key(user.pk): user.pk for user in users}
+        cached = cache.get_many(keys)
+        ids = {keys[key]: calendar_ids for key, calendar_ids in cached.items()}
+        missing = {user_id: set() for key, user_id in keys.items() if key not in cached}
+        if missing:
+            rows = self\
+                .filter(Q(owner__in=missing) | Q(subscribers__in=missing))\
+                .order_by()\
+                .values_list('id', 'owner_id', 'subscribers')
+            for calendar_id, owner_id, subscriber_id in rows:
+                for user_id in (owner_id, subscriber_id):
+                    if user_id in missing:
+                        missing[user_id].add(calendar_id)
+            computed = {user_id: sorted(calendar_ids) for user_id, calendar_ids in missing.items()}
+            cache.set_many(
+                {visible_calendars_key(user_id): calendar_ids for user_id, calendar_ids in computed.items()},
+                VISIBLE_CALENDARS_TIMEOUT
+            )
+            ids.update(computed)
+        return ids
+
     def owned(self, request):
         return self.get_queryset().owned(request)
 
@@ -43,6 +105,8 @@ class Calendar(models.Model):
     color = models.CharField(max_length=7, null=True, blank=True, default="#2222dd")
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     subscribers = models.ManyToManyField(User, related_name="calendars", blank=True)
+    # last change of the calendar or any of its events, see touch_calendars()
+    updated = models.DateTimeField(auto_now=True)
     # timezone
 
     objects = CalendarManager()
@@ -53,25 +117,135 @@ class Calendar(models.Model):
     def __str__(self):
         return f'{self.name} owned by {self.owner}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
+
     def get_absolute_url(self):
         return reverse("cal:calendar_detail", kwargs={"pk": self.pk})
 
 
+def calendar_owner_changed_receiver(sender, instance, *args, **kwargs):
+    user_ids = {instance.owner_id}
+    loaded_owner_id = getattr(instance, '_loaded_owner_id', None)
+    if loaded_owner_id:
+        user_ids.add(loaded_owner_id)
+    # subscribers of a deleted calendar keep a stale id until their entry
+    # expires, which is harmless as nothing matches it anymore
+    invalidate_visible_calendars(user_ids)
+    instance._loaded_owner_id = instance.owner_id
+
+
+post_save.connect(calendar_owner_changed_receiver, sender=Calendar)
+post_delete.connect(calendar_owner_changed_receiver, sender=Calendar)
+
+
+class EventQuerySet(models.QuerySet):
+    def between(self, start, end):
+        """
+        Events with an occurrence from start to end, both dates inclusive:
+        one-off events dated in the range and repeating series running
+        through it.
+        """
+        in_range = Q(date__gte=start, date__lte=end)
+        series = ~Q(repeat='none') & Q(date__lte=end) & (Q(repeat_until__isnull=True) | Q(repeat_until__gte=start))
+        return self.filter(in_range | series).order_by('date', 'start')
+
+    def occurrences(self, start, end):
+        """Lazily expand the events into their occurrences from start to end."""
+        return expand_occurrences(self.between(start, end), start, end)
+
+    def busy_by_calendar(self, start, end):
+        """
+        Merged busy intervals from start to end for each calendar, keyed by
+        calendar id. Reads only the fields needed to place occurrences.
+        """
+        events = self.between(start, end).only(
+            'calendar', 'date', 'start', 'end', 'whole_day', 'repeat', 'repeat_interval', 'repeat_until'
+        )
+        intervals = {}
+        for occurrence in expand_occurrences(events, start, end):
+            intervals.setdefault(occurrence.calendar_id, []).append(occurrence_interval(occurrence))
+        return {pk: merge_intervals(busy) for pk, busy in intervals.items()}
+
+    def with_guest_counts(self):
+        """Annotate guests_<status> counts, computed in the same query."""
+        return self.annotate(**{
+            f'guests_{status}': Count('participation', filter=Q(participation__status=status))
+            for status, _ in STATUS_CHOICES
+        })
+
+
 class EventManager(models.Manager):
+    def get_queryset(self):
+        return EventQuerySet(self.model, using=self._db)
+
     def owned(self, request):
         if request.user.is_authenticated:
             return self.filter(owner=request.user)
         return self.none()
 
     def available(self, request):
-        return self.get_queryset().filter(calendar__in=Calendar.objects.available(request))
+        if request.user.is_authenticated:
+            return self.get_queryset().filter(calendar_id__in=Calendar.objects.visible_ids(request.user))
+        return self.none()
 
     def by_calendar(self, request, calendar_id):
-        calendar = Calendar.objects.get(pk=calendar_id)
-        if calendar in Calendar.objects.available(request):
-            return self.get_queryset().filter(calendar=calendar)
+        if request.user.is_authenticated and calendar_id in Calendar.objects.visible_ids(request.user):
+            return self.get_queryset().filter(calendar_id=calendar_id)
         return self.get_queryset().none()
 
+    def between(self, request, start, end, calendar_id=None):
+        if calendar_id is not None:
+            qs = self.by_calendar(request, calendar_id)
+        else:
+            qs = self.available(request)
+        return qs.between(start, end)
+
+    def free_busy(self, users, start, end):
+        """
+        Merged busy intervals of each user's visible calendars from start to
+        end, keyed by user id. Results are cached per user until one of
+        their calendars changes. Visible calendars of all users are resolved
+        with one query and the missing events are read with another.
+        """
+        calendar_ids = Calendar.objects.visible_ids_for(users)
+        keys = {
+            user_id: calendar_fragment_key('freebusy', ids, start, end)
+            for user_id, ids in calendar_ids.items()
+        }
+        cached = cache.get_many(keys.values())
+        busy = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+
+        missing = [user_id for user_id in keys if user_id not in busy]
+        if missing:
+            ids = {pk for user_id in missing for pk in calendar_ids[user_id]}
+            by_calendar = self.get_queryset().filter(calendar_id__in=ids).busy_by_calendar(start, end)
+            computed = {}
+            for user_id in missing:
+                intervals = [i for pk in calendar_ids[user_id] for i in by_calendar.get(pk, [])]
+                computed[keys[user_id]] = busy[user_id] = merge_intervals(intervals)
+            cache.set_many(computed, CALENDAR_CACHE_TIMEOUT)
+        return busy
+
+
+REPEAT_CHOICES = (
+    ('none', 'Does not repeat'),
+    ('daily', 'Daily'),
+    ('weekly', 'Weekly'),
+    ('monthly', 'Monthly'),
+    ('yearly', 'Yearly')
+)
+
+REPEAT_FREQUENCIES = {
+    'daily': rrule.DAILY,
+    'weekly': rrule.WEEKLY,
+    'monthly': rrule.MONTHLY,
+    'yearly': rrule.YEARLY
+}
+
 
 class Event(models.Model):
     name = models.CharField(max_length=200)
@@ -92,22 +266,139 @@ class Event(models.Model):
 
     guests = models.ManyToManyField(User, through="Participation", related_name="as_guest_events", blank=True)
 
+    repeat = models.CharField(max_length=10, choices=REPEAT_CHOICES, default='none')
+    repeat_interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    repeat_until = models.DateField(null=True, blank=True)
+
     objects = EventManager()
 
-    # repeat
     # notification
     # timezone
     # guests permissions
 
     class Meta:
         order_with_respect_to = 'calendar'
+        indexes = [
+            models.Index(fields=['calendar', 'date']),
+            models.Index(fields=['calendar', 'date'], name='cal_event_series_idx', condition=~Q(repeat='none')),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the calendar the event was loaded from, so moving it to
+        # another calendar invalidates both of them
+        instance._loaded_calendar_id = instance.__dict__.get('calendar_id')
+        return instance
+
     def get_absolute_url(self):
         return reverse("cal:event_detail", kwargs={"pk": self.pk})
 
+    @property
+    def repeats(self):
+        return self.repeat != 'none'
+
+    def get_rule(self, after=None):
+        """
+        The recurrence rule of the series. Given a date after the first
+        occurrence, the rule starts at the last period boundary before it
+        instead, so reaching a window of an old series doesn't walk all of
+        its earlier occurrences. The boundary keeps the series' day of the
+        month and month of the year, so it yields the same dates.
+        """
+        dtstart = self.date
+        options = {}
+        interval = self.repeat_interval or 1
+        if after is not None and after > self.date:
+            if self.repeat in ('daily', 'weekly'):
+                step = interval * (7 if self.repeat == 'weekly' else 1)
+                dtstart = self.date + datetime.timedelta(days=(after - self.date).days // step * step)
+            elif self.repeat == 'monthly':
+                months = (after.year - self.date.year) * 12 + after.month - self.date.month
+                year, month = divmod(self.date.month - 1 + months // interval * interval, 12)
+                dtstart = datetime.date(self.date.year + year, month + 1, 1)
+                options['bymonthday'] = self.date.day
+            else:
+                years = (after.year - self.date.year) // interval * interval
+                dtstart = datetime.date(self.date.year + years, 1, 1)
+                options.update(bymonth=self.date.month, bymonthday=self.date.day)
+
+        until = None
+        if self.repeat_until:
+            until = datetime.datetime.combine(self.repeat_until, datetime.time.min)
+        return rrule.rrule(
+            REPEAT_FREQUENCIES[self.repeat],
+            dtstart=datetime.datetime.combine(dtstart, datetime.time.min),
+            interval=interval,
+            until=until,
+            **options
+        )
+
+    def occurrences(self, start, end):
+        """Yield the event's occurrences from start to end, computed one at a time."""
+        if not self.repeats:
+            if start <= self.date <= end:
+                yield Occurrence(self, self.date)
+            return
+
+        after = datetime.datetime.combine(start, datetime.time.min)
+        for dt in self.get_rule(start).xafter(after, inc=True):
+            if dt.date() > end:
+                break
+            yield Occurrence(self, dt.date())
+
+
+def touch_calendars(calendar_ids):
+    """
+    Mark the calendars as changed now. Event changes don't leave a trace
+    in the remaining events when one is deleted, so the feeds take their
+    Last-Modified from Calendar.updated instead.
+    """
+    Calendar.objects.filter(pk__in=calendar_ids).update(updated=timezone.now())
+
+
+def event_changed_receiver(sender, instance, *args, **kwargs):
+    calendar_ids = {instance.calendar_id}
+    loaded_calendar_id = getattr(instance, '_loaded_calendar_id', None)
+    if loaded_calendar_id:
+        calendar_ids.add(loaded_calendar_id)
+    for calendar_id in calendar_ids:
+        bump_calendar_version(calendar_id)
+    touch_calendars(calendar_ids)
+    instance._loaded_calendar_id = instance.calendar_id
+
+
+post_save.connect(event_changed_receiver, sender=Event)
+post_delete.connect(event_changed_receiver, sender=Event)
+
+
+def calendar_subscribers_changed_receiver(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(), remember who is affected
+        if reverse:
+            instance._cleared_pk_set = set(instance.calendars.values_list('id', flat=True))
+        else:
+            instance._cleared_pk_set = set(instance.subscribers.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pk_set', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        calendar_ids, user_ids = pk_set, {instance.pk}
+    else:
+        calendar_ids, user_ids = {instance.pk}, pk_set
+    for calendar_id in calendar_ids:
+        bump_calendar_version(calendar_id)
+    invalidate_visible_calendars(user_ids)
+
+
+m2m_changed.connect(calendar_subscribers_changed_receiver, sender=Calendar.subscribers.through)
+
 
 STATUS_CHOICES = (
     ('accept', 'Accepted'),
@@ -122,14 +413,24 @@ class Participation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='none')
 
+    class Meta:
+        unique_together = ('event', 'user')
+
 
 class CalendarShareTokenManager(models.Manager):
     def active(self):
         return self.get_queryset().filter(active=True)
 
+    def lookup(self, token, active_only=False):
+        """Return the token with its calendar, or None if there is no such token."""
+        qs = self.active() if active_only else self.get_queryset()
+        return qs.select_related('calendar').filter(token=token).first()
+
 
 class CalendarShareToken(models.Model):
-    token = models.CharField(max_length=50, blank=True)
+    SAVE_ATTEMPTS = 3
+
+    token = models.CharField(max_length=50, unique=True, blank=True)
     calendar = models.OneToOneField(Calendar, on_delete=models.CASCADE, related_name='share_token')
     active = models.BooleanField(default=False)
 
@@ -138,15 +439,30 @@ class CalendarShareToken(models.Model):
     def __str__(self):
         return self.token
 
+    def save(self, *args, **kwargs):
+        if self.token:
+            return super().save(*args, **kwargs)
+        # a fresh token is unique in practice, the unique index catches the rest
+        for attempt in range(self.SAVE_ATTEMPTS):
+            self.token = share_token_generator()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.SAVE_ATTEMPTS - 1:
+                    raise
+
+    def rotate(self):
+        """Replace the token, so links shared before stop working."""
+        self.token = ''
+        self.save()
+
     def get_url(self, request=None):
         if request:
             return request.build_absolute_uri(reverse('cal:share_link', kwargs={'token': self.token}))
         return reverse('cal:share_link', kwargs={'token': self.token})
 
-
-def share_token_pre_save_receiver(sender, instance, *args, **kwargs):
-    if instance.active or not instance.token:
-        instance.token = token_generator(instance)
-
-
-pre_save.connect(share_token_pre_save_receiver, sender=CalendarShareToken)
+    def get_feed_url(self, request=None):
+        if request:
+            return request.build_absolute_uri(reverse('cal:share_feed', kwargs={'token': self.token}))
+        return reverse('cal:share_feed', kwargs={'token': self.token})
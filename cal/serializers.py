@@ -0,0 +1,70 @@
+from rest_framework import serializers
+from django.contrib.auth import get_user_model
+
+from courses.models import Course
+from .models import Event, STATUS_CHOICES
+
+User = get_user_model()
+
+
+class EventSerializer(serializers.ModelSerializer):
+    guests_accept = serializers.IntegerField(read_only=True)
+    guests_perhaps = serializers.IntegerField(read_only=True)
+    guests_rejected = serializers.IntegerField(read_only=True)
+    guests_none = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Event
+        fields = ['id', 'name', 'body', 'color', 'calendar', 'owner', 'date', 'start', 'end', 'whole_day',
+                  'place', 'repeat', 'repeat_interval', 'repeat_until',
+                  'guests_accept', 'guests_perhaps', 'guests_rejected', 'guests_none']
+
+
+class InviteSerializer(serializers.Serializer):
+    course = serializers.SlugRelatedField(slug_field='slug', queryset=Course.objects.all(), required=False)
+    users = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=5000)
+
+    def validate_course(self, course):
+        user = self.context['request'].user
+        if not (user == course.owner or user.is_admin or user.is_staff
+                or course.admins.filter(pk=user.pk).exists()):
+            raise serializers.ValidationError("You can't invite participants of this course")
+        return course
+
+    def validate_users(self, user_ids):
+        # one query for the whole list, PrimaryKeyRelatedField runs one per id
+        user_ids = set(user_ids)
+        found = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        unknown = sorted(user_ids - found)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown users: {', '.join(map(str, unknown))}")
+        return found
+
+    def validate(self, data):
+        if not data.get('course') and not data.get('users'):
+            raise serializers.ValidationError("Provide a course or a list of users")
+        return data
+
+
+class ResponseSerializer(serializers.Serializer):
+    event = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=STATUS_CHOICES)
+
+
+class RsvpSerializer(serializers.Serializer):
+    responses = ResponseSerializer(many=True)
+
+
+class FreeBusySerializer(serializers.Serializer):
+    MAX_DAYS = 366
+
+    users = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=500)
+    start = serializers.DateField()
+    end = serializers.DateField()
+
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("Start must not be after end")
+        if (data['end'] - data['start']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Range can't be longer than {self.MAX_DAYS} days")
+        return data
@@ -1,10 +1,16 @@
 import calendar
 import datetime
 from django import template
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
-from cal.utils import YearCustomHTMLCal, MonthCustomHTMLCal
+from cal.utils import (
+    YearCustomHTMLCal,
+    MonthCustomHTMLCal,
+    CALENDAR_CACHE_TIMEOUT,
+    calendar_fragment_key
+)
 
-from ..models import Event
+from ..models import Calendar, Event
 
 register = template.Library()
 
@@ -12,14 +18,36 @@ register = template.Library()
 @register.filter
 def month_name(num):
     return calendar.month_name[num]
-    
+
+
+def get_calendar_ids(context):
+    """
+    Calendars whose events feed the rendered grid. Views listing events
+    pass them in the context, other pages show all available calendars.
+    """
+    if 'calendar_ids' in context:
+        return context['calendar_ids']
+    user = context['request'].user
+    if user.is_authenticated:
+        return Calendar.objects.visible_ids(user)
+    return []
+
 
 @register.simple_tag(takes_context=True)
 def get_year_calendar(context):
     year = context['year']
-    events = context['object_list']
-    cal = YearCustomHTMLCal(events=events)
-    return mark_safe(cal.formatyear(year))
+    key = calendar_fragment_key('year', get_calendar_ids(context), year)
+    html = cache.get(key)
+    if html is None:
+        # the events are only read when the grid has to be rendered
+        cal = YearCustomHTMLCal(
+            events=context['object_list'],
+            start=datetime.date(year, 1, 1),
+            end=datetime.date(year, 12, 31)
+        )
+        html = cal.formatyear(year)
+        cache.set(key, html, CALENDAR_CACHE_TIMEOUT)
+    return mark_safe(html)
 
 
 @register.simple_tag(takes_context=True)
@@ -27,6 +55,16 @@ def get_month_calendar(context):
     now = datetime.datetime.now()
     year = context.get('year') or now.year
     month = context.get('month') or now.month
-    events = context.get('object_list') or Event.objects.available(context['request'])
-    cal = MonthCustomHTMLCal(events=events)
-    return mark_safe(cal.formatmonth(year, month))
+    key = calendar_fragment_key('month', get_calendar_ids(context), year, month)
+    html = cache.get(key)
+    if html is None:
+        start = datetime.date(year, month, 1)
+        end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+        if 'object_list' in context:
+            events = context['object_list']
+        else:
+            events = Event.objects.available(context['request']).between(start, end)
+        cal = MonthCustomHTMLCal(events=events, start=start, end=end)
+        html = cal.formatmonth(year, month)
+        cache.set(key, html, CALENDAR_CACHE_TIMEOUT)
+    return mark_safe(html)
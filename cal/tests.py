@@ -1,3 +1,584 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import time
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import ics
+from .importers import import_events, read_rows
+from .models import Calendar, CalendarShareToken, Event, Participation, User
+from .utils import Occurrence, expand_occurrences, index_events
+
+
+def make_event(calendar, date, **kwargs):
+    # _order of order_with_respect_to is only set by save(), not bulk_create()
+    fields = {'name': 'Lesson', 'body': '', 'place': 'Room 1', 'owner': calendar.owner, '_order': 0, **kwargs}
+    return Event(calendar=calendar, date=date, **fields)
+
+
+class CalendarTestData:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('teacher@example.com', password='secret', is_teacher=True)
+        cls.calendar = Calendar.objects.create(name='Timetable', owner=cls.user)
+
+    def setUp(self):
+        # rendered grids and visible calendars are cached per calendar id,
+        # which the next test reuses
+        cache.clear()
+
+
+class IndexEventsTests(CalendarTestData, TestCase):
+    def test_queryset(self):
+        day = datetime.date(2026, 3, 2)
+        Event.objects.bulk_create([
+            make_event(self.calendar, day, start=datetime.time(12), color='#222222'),
+            make_event(self.calendar, day, color='#111111'),
+            make_event(self.calendar, day + datetime.timedelta(days=1), color='#333333'),
+            make_event(self.calendar, day - datetime.timedelta(days=7), repeat='weekly', start=datetime.time(8),
+                       color='#444444'),
+        ])
+        events = Event.objects.filter(calendar=self.calendar)
+
+        index = index_events(events, day, day + datetime.timedelta(days=13))
+        self.assertEqual(index, {
+            day: ['#111111', '#444444', '#222222'],
+            day + datetime.timedelta(days=1): ['#333333'],
+            day + datetime.timedelta(days=7): ['#444444'],
+        })
+
+    def test_occurrences(self):
+        day = datetime.date(2026, 3, 2)
+        event = make_event(self.calendar, day, color='#111111')
+        index = index_events([Occurrence(event, day), Occurrence(event, day), Occurrence(event, day.replace(day=3))])
+        self.assertEqual(index, {day: ['#111111', '#111111'], day.replace(day=3): ['#111111']})
+
+
+class BetweenTests(CalendarTestData, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def names(self, start, end, calendar_id=None):
+        events = Event.objects.between(self.request, start, end, calendar_id=calendar_id)
+        return [event.name for event in events]
+
+    def test_one_off_events(self):
+        Event.objects.bulk_create([
+            make_event(self.calendar, datetime.date(2026, 2, 28), name='before'),
+            make_event(self.calendar, datetime.date(2026, 3, 1), name='first', start=datetime.time(9)),
+            make_event(self.calendar, datetime.date(2026, 3, 1), name='all day'),
+            make_event(self.calendar, datetime.date(2026, 3, 31), name='last'),
+            make_event(self.calendar, datetime.date(2026, 4, 1), name='after'),
+        ])
+        names = self.names(datetime.date(2026, 3, 1), datetime.date(2026, 3, 31))
+        self.assertEqual(names, ['all day', 'first', 'last'])
+
+    def test_series(self):
+        Event.objects.bulk_create([
+            make_event(self.calendar, datetime.date(2025, 9, 1), name='weekly', repeat='weekly'),
+            make_event(self.calendar, datetime.date(2025, 9, 1), name='ended', repeat='weekly',
+                       repeat_until=datetime.date(2026, 2, 28)),
+            make_event(self.calendar, datetime.date(2025, 9, 1), name='ends in range', repeat='daily',
+                       repeat_until=datetime.date(2026, 3, 1)),
+            make_event(self.calendar, datetime.date(2026, 4, 1), name='not started', repeat='daily'),
+        ])
+        names = self.names(datetime.date(2026, 3, 1), datetime.date(2026, 3, 31))
+        self.assertEqual(sorted(names), ['ends in range', 'weekly'])
+
+    def test_only_visible_calendars(self):
+        other = Calendar.objects.create(
+            name='Other', owner=User.objects.create_user('other@example.com', password='secret')
+        )
+        day = datetime.date(2026, 3, 2)
+        Event.objects.bulk_create([make_event(self.calendar, day, name='mine'), make_event(other, day, name='other')])
+
+        self.assertEqual(self.names(day, day), ['mine'])
+        self.assertEqual(self.names(day, day, calendar_id=other.pk), [])
+
+        other.subscribers.add(self.user)
+        self.assertEqual(sorted(self.names(day, day)), ['mine', 'other'])
+        self.assertEqual(self.names(day, day, calendar_id=other.pk), ['other'])
+
+
+@skipUnless(connection.vendor == 'postgresql', "the plans are only checked on PostgreSQL")
+class BetweenPlanTests(TestCase):
+    """A year of events across 500 calendars, read by date range through the (calendar, date) index."""
+    calendars = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('teacher@example.com', password='secret', is_teacher=True)
+        Calendar.objects.bulk_create(Calendar(name=f'Calendar {i}', owner=owner) for i in range(cls.calendars))
+        first_day = datetime.date(2026, 1, 1)
+        Event.objects.bulk_create(
+            (
+                make_event(calendar, first_day + datetime.timedelta(days=day), owner=owner)
+                for calendar in Calendar.objects.all()
+                for day in range(0, 365, 3)
+            ),
+            batch_size=5000
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE cal_event')
+        cls.calendar_ids = list(Calendar.objects.order_by('pk').values_list('pk', flat=True)[:5])
+
+    def test_month_of_some_calendars(self):
+        events = Event.objects.filter(calendar_id__in=self.calendar_ids)\
+            .between(datetime.date(2026, 3, 1), datetime.date(2026, 3, 31))
+        plan = events.explain()
+        self.assertIn('Index', plan)
+        self.assertNotIn('Seq Scan on cal_event', plan)
+
+    def test_day_of_one_calendar(self):
+        day = datetime.date(2026, 3, 4)
+        events = Event.objects.filter(calendar_id=self.calendar_ids[0]).between(day, day)
+        self.assertNotIn('Seq Scan on cal_event', events.explain())
+
+
+class OccurrenceTests(SimpleTestCase):
+    def dates(self, event, start, end):
+        return [occurrence.date for occurrence in event.occurrences(start, end)]
+
+    def all_dates(self, event, start, end):
+        # the rule started from the series' first date, without alignment
+        return [dt.date() for dt in event.get_rule() if start <= dt.date() <= end]
+
+    def test_one_off(self):
+        event = Event(date=datetime.date(2026, 3, 2))
+        self.assertEqual(self.dates(event, datetime.date(2026, 3, 1), datetime.date(2026, 3, 2)), [event.date])
+        self.assertEqual(self.dates(event, datetime.date(2026, 3, 3), datetime.date(2026, 3, 31)), [])
+
+    def test_old_series_match_the_full_rule(self):
+        series = (
+            ('daily', 3, datetime.date(2001, 1, 1)),
+            ('weekly', 2, datetime.date(2001, 1, 1)),
+            ('monthly', 1, datetime.date(2001, 1, 31)),
+            ('monthly', 5, datetime.date(2001, 3, 30)),
+            ('yearly', 1, datetime.date(2000, 2, 29)),
+            ('yearly', 3, datetime.date(2001, 7, 15)),
+        )
+        windows = (
+            (datetime.date(2026, 1, 1), datetime.date(2026, 12, 31)),
+            (datetime.date(2028, 2, 1), datetime.date(2028, 3, 31)),
+        )
+        for repeat, interval, date in series:
+            event = Event(date=date, repeat=repeat, repeat_interval=interval, repeat_until=datetime.date(2040, 1, 1))
+            for start, end in windows:
+                with self.subTest(repeat=repeat, interval=interval, date=date, start=start):
+                    self.assertEqual(self.dates(event, start, end), self.all_dates(event, start, end))
+
+    def test_repeat_until(self):
+        event = Event(date=datetime.date(2026, 3, 2), repeat='daily', repeat_until=datetime.date(2026, 3, 4))
+        dates = self.dates(event, datetime.date(2026, 3, 1), datetime.date(2026, 3, 31))
+        self.assertEqual(dates, [datetime.date(2026, 3, 2), datetime.date(2026, 3, 3), datetime.date(2026, 3, 4)])
+
+    def test_expand_occurrences_in_order(self):
+        weekly = Event(name='weekly', date=datetime.date(2026, 3, 2), start=datetime.time(10), repeat='weekly')
+        early = Event(name='early', date=datetime.date(2026, 3, 9), start=datetime.time(8))
+        whole_day = Event(name='whole day', date=datetime.date(2026, 3, 9))
+        occurrences = expand_occurrences([weekly, early, whole_day], datetime.date(2026, 3, 1), datetime.date(2026, 3, 10))
+        self.assertEqual(
+            [(o.date.day, o.name) for o in occurrences],
+            [(2, 'weekly'), (9, 'whole day'), (9, 'early'), (9, 'weekly')]
+        )
+
+
+class YearViewTests(CalendarTestData, TestCase):
+    def test_year_grid(self):
+        Event.objects.bulk_create([
+            make_event(self.calendar, datetime.date(2026, 5, 4), color='#123456'),
+            make_event(self.calendar, datetime.date(2026, 5, 4)),
+        ])
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('cal:m_calendar_events_list'), {'year': 2026})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'style="color: #123456" title="2 events"', html=False)
+        self.assertContains(response, '?year=2026&month=5&day=4', html=False)
+
+    def test_cached_grid_reads_no_events(self):
+        self.client.force_login(self.user)
+        url = reverse('cal:m_calendar_events_list')
+        self.client.get(url, {'year': 2026})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'year': 2026})
+        self.assertFalse([q for q in queries if 'cal_event' in q['sql']])
+
+
+@tag('benchmark')
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "set RUN_BENCHMARKS=1 to run benchmarks")
+class YearViewBenchmark(CalendarTestData, TestCase):
+    """Renders a year view of one calendar with more and more events."""
+    sizes = (1000, 10000, 30000)
+
+    def render_year(self, year):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.client.get(reverse('cal:m_calendar_events_list'), {'year': year})
+            elapsed = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200)
+        return elapsed, len(queries)
+
+    def test_year_view(self):
+        self.client.force_login(self.user)
+        # the first request loads templates and warms the connection
+        self.render_year(2026)
+        first_day = datetime.date(2026, 1, 1)
+        created = 0
+        timings, query_counts = {}, {}
+        for size in self.sizes:
+            Event.objects.bulk_create(
+                make_event(
+                    self.calendar, first_day + datetime.timedelta(days=i % 365),
+                    start=datetime.time(i % 24), color='#%06x' % (i % 0xffffff)
+                )
+                for i in range(created, size)
+            )
+            created = size
+            timings[size], query_counts[size] = self.render_year(2026)
+
+        smallest, largest = self.sizes[0], self.sizes[-1]
+        # the number of queries doesn't depend on the number of events
+        self.assertEqual(len(set(query_counts.values())), 1, query_counts)
+        # every event is read once, so the time per event doesn't grow; it
+        # did when each of the 365 cells went through all events
+        self.assertLess(
+            timings[largest] / largest, timings[smallest] / smallest,
+            f"{largest} events took {timings[largest] * 1000:.1f} ms, "
+            f"{smallest} events {timings[smallest] * 1000:.1f} ms"
+        )
+
+
+class ICSWriterTests(SimpleTestCase):
+    def test_escape(self):
+        self.assertEqual(ics.escape('a;b,c\\d\r\ne\nf'), 'a\\;b\\,c\\\\d\\ne\\nf')
+        self.assertEqual(ics.escape(None), '')
+
+    def test_short_line_is_not_folded(self):
+        self.assertEqual(ics.fold('SUMMARY:Maths'), 'SUMMARY:Maths\r\n')
+        self.assertEqual(ics.fold('X' * 75), 'X' * 75 + '\r\n')
+
+    def test_fold(self):
+        line = 'DESCRIPTION:' + 'x' * 200
+        folded = ics.fold(line)
+        parts = folded.split('\r\n')
+        self.assertEqual(parts[-1], '')
+        self.assertTrue(all(len(part.encode()) <= 75 for part in parts))
+        self.assertTrue(all(part.startswith(' ') for part in parts[1:-1]))
+        self.assertEqual(list(ics.unfold(folded.splitlines(keepends=True))), [line])
+
+    def test_fold_keeps_characters_whole(self):
+        line = 'SUMMARY:' + 'zażółć gęślą jaźń ' * 10
+        folded = ics.fold(line)
+        parts = folded.split('\r\n')[:-1]
+        # decoding would have failed on a split character
+        self.assertTrue(all(len(part.encode()) <= 75 for part in parts))
+        self.assertEqual(''.join(part[1:] if i else part for i, part in enumerate(parts)), line)
+
+    def make_event(self, **kwargs):
+        fields = {
+            'pk': 7, 'name': 'Maths, room 5', 'body': 'Bring\na calculator', 'place': '',
+            'date': datetime.date(2026, 3, 2), 'start': datetime.time(8, 0), 'end': datetime.time(8, 45),
+            'whole_day': False, 'repeat': 'none', 'repeat_interval': 1, 'repeat_until': None,
+            'updated': datetime.datetime(2026, 1, 5, 12, 30, tzinfo=datetime.timezone.utc),
+            **kwargs
+        }
+        return Event(**fields)
+
+    def test_timed_event(self):
+        lines = list(ics.event_lines(self.make_event(), 'example.com'))
+        self.assertEqual(lines, [
+            'BEGIN:VEVENT',
+            'UID:event-7@example.com',
+            'DTSTAMP:20260105T123000Z',
+            'LAST-MODIFIED:20260105T123000Z',
+            'DTSTART:20260302T080000',
+            'DTEND:20260302T084500',
+            'SUMMARY:Maths\\, room 5',
+            'DESCRIPTION:Bring\\na calculator',
+            'END:VEVENT',
+        ])
+
+    def test_whole_day_series(self):
+        event = self.make_event(
+            start=None, end=None, place='Gym', repeat='weekly', repeat_interval=2,
+            repeat_until=datetime.date(2026, 6, 26)
+        )
+        lines = list(ics.event_lines(event, 'example.com'))
+        self.assertIn('DTSTART;VALUE=DATE:20260302', lines)
+        self.assertIn('DTEND;VALUE=DATE:20260303', lines)
+        self.assertIn('RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL=20260626', lines)
+        self.assertIn('LOCATION:Gym', lines)
+
+    def test_timed_series_ends_with_its_last_day(self):
+        event = self.make_event(repeat='daily', repeat_until=datetime.date(2026, 3, 6))
+        lines = list(ics.event_lines(event, 'example.com'))
+        self.assertIn('RRULE:FREQ=DAILY;INTERVAL=1;UNTIL=20260306T235959', lines)
+
+    def test_iter_calendar(self):
+        calendar = Calendar(name='Class 3A')
+        chunks = list(ics.iter_calendar(calendar, [self.make_event(), self.make_event(pk=8)], 'example.com'))
+        self.assertEqual(len(chunks), 4)
+        document = ''.join(chunks)
+        self.assertTrue(document.startswith('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'))
+        self.assertTrue(document.endswith('END:VCALENDAR\r\n'))
+        self.assertIn('X-WR-CALNAME:Class 3A\r\n', document)
+        self.assertEqual(document.count('BEGIN:VEVENT'), 2)
+
+
+class CalendarFeedTests(CalendarTestData, TestCase):
+    def setUp(self):
+        super().setUp()
+        token = CalendarShareToken.objects.create(calendar=self.calendar, active=True)
+        self.url = reverse('cal:share_feed', kwargs={'token': token.token})
+
+    def test_feed(self):
+        for i in range(3):
+            make_event(self.calendar, datetime.date(2026, 3, 2 + i), name=f'Lesson {i}').save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(response.streaming)
+        document = b''.join(response.streaming_content).decode()
+        self.assertEqual(document.count('BEGIN:VEVENT'), 3)
+        self.assertIn('SUMMARY:Lesson 2\r\n', document)
+
+    def test_not_modified(self):
+        make_event(self.calendar, datetime.date(2026, 3, 2)).save()
+        response = self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        make_event(self.calendar, datetime.date(2026, 3, 3)).save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def last_modified_a_minute_ago(self):
+        # Last-Modified has whole seconds, move the last change out of this one
+        minute_ago = timezone.now() - datetime.timedelta(minutes=1)
+        Calendar.objects.filter(pk=self.calendar.pk).update(updated=minute_ago)
+        return self.client.get(self.url)['Last-Modified']
+
+    def test_deleting_an_event_changes_last_modified(self):
+        event = make_event(self.calendar, datetime.date(2026, 3, 2))
+        event.save()
+        last_modified = self.last_modified_a_minute_ago()
+
+        event.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_renaming_the_calendar_changes_last_modified(self):
+        last_modified = self.last_modified_a_minute_ago()
+
+        calendar = Calendar.objects.get(pk=self.calendar.pk)
+        calendar.name = 'Timetable 3A'
+        calendar.save()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-WR-CALNAME:Timetable 3A', b''.join(response.streaming_content).decode())
+
+    def test_import_changes_last_modified(self):
+        last_modified = self.last_modified_a_minute_ago()
+
+        import_events(self.calendar, self.user, [{'name': 'Maths', 'date': '2026-03-02', 'guests': []}])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_inactive_or_unknown_token(self):
+        CalendarShareToken.objects.update(active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('cal:share_feed', kwargs={'token': 'nope'})).status_code, 404)
+
+
+ICS_FILE = (
+    'BEGIN:VCALENDAR\r\n'
+    'VERSION:2.0\r\n'
+    'BEGIN:VEVENT\r\n'
+    'SUMMARY:Maths\\, room 5\r\n'
+    'DESCRIPTION:Bring a calculator\\nand a rul\r\n'
+    ' er\r\n'
+    'DTSTART:20260302T080000\r\n'
+    'DTEND:20260302T084500\r\n'
+    'RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL=20260626T235959\r\n'
+    'ATTENDEE;CN=Ann:mailto:ann@example.com\r\n'
+    'END:VEVENT\r\n'
+    'BEGIN:VEVENT\r\n'
+    'SUMMARY:Trip\r\n'
+    'DTSTART;VALUE=DATE:20260515\r\n'
+    'END:VEVENT\r\n'
+    'END:VCALENDAR\r\n'
+)
+
+
+class ICSParserTests(SimpleTestCase):
+    def test_unfold(self):
+        lines = ['DESCRIPTION:a long\r\n', ' line\r\n', '\tagain\r\n', 'SUMMARY:x\r\n', '\r\n']
+        self.assertEqual(list(ics.unfold(lines)), ['DESCRIPTION:a longlineagain', 'SUMMARY:x'])
+
+    def test_parse_line(self):
+        self.assertEqual(
+            ics.parse_line('dtstart;value=DATE:20260515'), ('DTSTART', {'VALUE': 'DATE'}, '20260515')
+        )
+
+    def test_parse_events(self):
+        first, second = ics.parse_events(io.StringIO(ICS_FILE))
+        self.assertEqual(first, {
+            'name': 'Maths, room 5',
+            'body': 'Bring a calculator\nand a ruler',
+            'date': datetime.date(2026, 3, 2),
+            'start': datetime.time(8, 0),
+            'end': datetime.time(8, 45),
+            'whole_day': False,
+            'repeat': 'weekly',
+            'repeat_interval': '2',
+            'repeat_until': datetime.date(2026, 6, 26),
+            'guests': ['ann@example.com'],
+        })
+        self.assertEqual(second, {
+            'name': 'Trip', 'date': datetime.date(2026, 5, 15), 'start': None, 'whole_day': True, 'guests': [],
+        })
+
+    def test_invalid_dates_are_left_for_validation(self):
+        lines = ['BEGIN:VEVENT', 'DTSTART:2026-03-02', 'RRULE:FREQ=DAILY;UNTIL=soon', 'END:VEVENT']
+        row, = ics.parse_events(lines)
+        self.assertEqual(row['date'], '2026-03-02')
+        self.assertEqual(row['repeat_until'], 'FREQ=DAILY;UNTIL=soon')
+
+    def test_round_trip(self):
+        event = Event(
+            pk=1, name='Maths; algebra', body='Line one\nline two', place='Room 5',
+            date=datetime.date(2026, 3, 2), start=datetime.time(8), end=datetime.time(9), whole_day=False,
+            repeat='monthly', repeat_interval=1, repeat_until=None,
+            updated=datetime.datetime(2026, 1, 5, tzinfo=datetime.timezone.utc)
+        )
+        document = ''.join(ics.iter_calendar(Calendar(name='3A'), [event], 'example.com'))
+        row, = ics.parse_events(io.StringIO(document))
+        self.assertEqual(
+            (row['name'], row['body'], row['place'], row['date'], row['start'], row['end'], row['repeat']),
+            (event.name, event.body, event.place, event.date, event.start, event.end, event.repeat)
+        )
+
+
+class ReadRowsTests(SimpleTestCase):
+    def test_csv(self):
+        data = 'Name,Date,Start,Guests\nMaths,2026-03-02,08:00,ann@example.com; bob@example.com\n'
+        rows = list(read_rows(io.BytesIO(data.encode('utf-8-sig')), 'timetable.csv'))
+        self.assertEqual(rows, [{
+            'name': 'Maths', 'date': '2026-03-02', 'start': '08:00',
+            'guests': ['ann@example.com', 'bob@example.com'],
+        }])
+
+    def test_ics(self):
+        rows = list(read_rows(io.BytesIO(ICS_FILE.encode()), 'TIMETABLE.ICS'))
+        self.assertEqual([row['name'] for row in rows], ['Maths, room 5', 'Trip'])
+
+    def test_not_utf8(self):
+        data = 'name,date\nMatematyka źródła,2026-03-02\n'.encode('cp1250')
+        with self.assertRaisesMessage(ValidationError, 'UTF-8'):
+            list(read_rows(io.BytesIO(data), 'timetable.csv'))
+
+    def test_invalid_csv(self):
+        data = 'name,date\n"' + 'x' * 200000 + '",2026-03-02\n'
+        with self.assertRaisesMessage(ValidationError, 'not a valid CSV file'):
+            list(read_rows(io.BytesIO(data.encode()), 'timetable.csv'))
+
+
+class ImportEventsTests(CalendarTestData, TestCase):
+    def rows(self, *rows):
+        return ({'guests': [], **row} for row in rows)
+
+    def test_import(self):
+        make_event(self.calendar, datetime.date(2026, 3, 1)).save()
+        result = import_events(self.calendar, self.user, self.rows(
+            {'name': 'Maths', 'date': '2026-03-02', 'start': '08:00', 'color': '#00ff00'},
+            {'name': 'Trip', 'date': '2026-05-15', 'whole_day': 'true', 'repeat': 'yearly'},
+        ), batch_size=1)
+
+        self.assertEqual((result.created, result.failed), (2, 0))
+        # imported events continue the calendar's order
+        events = self.calendar.events.order_by('_order').values_list('name', '_order', 'color', 'repeat')
+        self.assertEqual(list(events[1:]), [
+            ('Maths', 1, '#00ff00', 'none'),
+            ('Trip', 2, self.calendar.color, 'yearly'),
+        ])
+
+    def test_invalid_rows_are_reported(self):
+        result = import_events(self.calendar, self.user, self.rows(
+            {'name': 'Maths', 'date': '2026-03-02'},
+            {'name': '', 'date': 'tomorrow'},
+            {'name': 'Physics', 'date': '2026-03-03', 'repeat': 'hourly'},
+        ))
+        self.assertEqual((result.created, result.failed), (1, 2))
+        self.assertEqual([row_number for row_number, _ in result.errors], [2, 3])
+        self.assertEqual(set(result.errors[0][1]), {'name', 'date'})
+
+    @skipUnless(connection.features.can_return_rows_from_bulk_insert, "guests need the ids of inserted events")
+    def test_guests(self):
+        ann = User.objects.create_user('Ann@example.com', password='secret')
+        result = import_events(self.calendar, self.user, self.rows(
+            {'name': 'Maths', 'date': '2026-03-02', 'guests': ['ann@example.com', 'ANN@example.com', 'who@example.com']},
+        ))
+        self.assertEqual(result.created, 1)
+        self.assertEqual(list(Participation.objects.values_list('user', flat=True)), [ann.pk])
+
+    def test_import_view(self):
+        self.client.force_login(self.user)
+        url = reverse('cal:calendar_import', kwargs={'pk': self.calendar.pk})
+        data = b'name,date\nMaths,2026-03-02\nPhysics,someday\n'
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('timetable.csv', data)})
+        self.assertContains(response, 'Imported 1 events, 1 rows skipped')
+        self.assertEqual(self.calendar.events.count(), 1)
+
+    def test_import_view_rejects_unreadable_files(self):
+        self.client.force_login(self.user)
+        url = reverse('cal:calendar_import', kwargs={'pk': self.calendar.pk})
+        data = 'name,date\nMaths,2026-03-02\nMatematyka źródła,2026-03-03\n'.encode('cp1250')
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('timetable.csv', data)})
+        self.assertContains(response, 'The file must be UTF-8 encoded text')
+        self.assertFalse(self.calendar.events.exists())
+
+
+class InviteTests(CalendarTestData, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.calendar, datetime.date(2026, 5, 4))
+        self.event.save()
+        self.url = reverse('api:events-invite', kwargs={'pk': self.event.pk})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_invite_users(self):
+        User.objects.bulk_create(User(email=f'student{i}@example.com', password='') for i in range(30))
+        guest_ids = list(User.objects.filter(email__startswith='student').values_list('pk', flat=True))
+        # visible calendars, the event, its owner, the ids, the insert, the count
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, {'users': guest_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'guests': 30})
+
+    def test_unknown_users(self):
+        student = User.objects.create_user('student@example.com', password='secret')
+        response = self.client.post(
+            self.url, {'users': [student.pk, 99998, 99999]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'users': ['Unknown users: 99998, 99999']})
+        self.assertFalse(Participation.objects.exists())
@@ -17,7 +17,9 @@ from .views import (
         EventCreateView,
         ShareLinkView,
         CalendarRemoveSubscriberView,
-        CalendarAddSubscriberView
+        CalendarAddSubscriberView,
+        CalendarFeedView,
+        CalendarImportView
     )
 
 app_name = 'cal'
@@ -31,6 +33,7 @@ urlpatterns = [
     path('<int:pk>/delete/', CalendarDeleteView.as_view(), name="calendar_delete"),
     path('<int:pk>/events/', CalendarEventsView.as_view(), name="calendar_events_list"),
     path('<int:pk>/share/', CalendarShareView.as_view(), name="calendar_share"),
+    path('<int:pk>/import/', CalendarImportView.as_view(), name="calendar_import"),
     path('<int:pk>/subscribers/remove', CalendarRemoveSubscriberView.as_view(), name="calendar_remove_subscriber"),
     path('<int:pk>/subscribers/add', CalendarAddSubscriberView.as_view(), name="calendar_add_subscriber"),
     path('delete/success', CalendarDeleteSuccessView.as_view(), name="calendar_delete_success"),
@@ -39,7 +42,8 @@ urlpatterns = [
     path('event/<int:pk>/', EventDetailView.as_view(), name="event_detail"),
     path('event/<int:pk>/edit/', EventUpdateView.as_view(), name="event_edit"),
     path('event/<int:pk>/delete/', EventDeleteView.as_view(), name="event_delete"),
-    path('share/<token>/', ShareLinkView.as_view(), name="share_link")
+    path('share/<token>/', ShareLinkView.as_view(), name="share_link"),
+    path('share/<token>/calendar.ics', CalendarFeedView.as_view(), name="share_feed")
 ]
 
 handler404 = 'cal.views.handler404'
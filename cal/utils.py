@@ -1,21 +1,153 @@
 import calendar
 import datetime
-import random
-import string
+import hashlib
+import heapq
+import secrets
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
 from django.urls import reverse
 
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+# The default cache is LocMemCache, which is local to each process, so a
+# version bumped in one worker is not seen by the others. Version keys
+# expire after this many seconds instead, which bounds how long another
+# worker serves a stale grid. None keeps them forever with a shared cache.
+CALENDAR_VERSION_TIMEOUT = getattr(settings, 'CALENDAR_VERSION_TIMEOUT', 60)
+# the same goes for the calendars a user may see: invalidation only reaches
+# the worker that made the change, so other workers keep them this long
+VISIBLE_CALENDARS_TIMEOUT = getattr(settings, 'VISIBLE_CALENDARS_TIMEOUT', 60)
+DEFAULT_EVENT_DURATION = datetime.timedelta(hours=1)
 
-class YearCustomHTMLCal(calendar.HTMLCalendar):
+
+class Occurrence:
+    """
+    Single occurrence of an event. Reads like the event itself, only the
+    date differs for repeating events.
+    """
+    def __init__(self, event, date):
+        self.event = event
+        self.date = date
+
+    def __getattr__(self, name):
+        return getattr(self.event, name)
+
+    def __str__(self):
+        return str(self.event)
+
+
+def occurrence_sort_key(occurrence):
+    return occurrence.date, occurrence.start or datetime.time.min
+
+
+def expand_occurrences(events, start, end):
+    """
+    Merge the occurrences of all events from start to end in date order.
+    Every series is expanded lazily, one occurrence at a time, and nothing
+    is read, not even the events, until the first occurrence is needed.
+    """
+    yield from heapq.merge(
+        *(event.occurrences(start, end) for event in events),
+        key=occurrence_sort_key
+    )
+
+
+def occurrence_interval(occurrence):
+    """
+    Busy (start, end) datetimes of an occurrence. Events without a time
+    block the whole day, events without a valid end last an hour.
+    """
+    if occurrence.whole_day or occurrence.start is None:
+        start = datetime.datetime.combine(occurrence.date, datetime.time.min)
+        return start, start + datetime.timedelta(days=1)
+    start = datetime.datetime.combine(occurrence.date, occurrence.start)
+    if occurrence.end is None or occurrence.end <= occurrence.start:
+        return start, start + DEFAULT_EVENT_DURATION
+    return start, datetime.datetime.combine(occurrence.date, occurrence.end)
+
+
+def merge_intervals(intervals):
+    """Merge overlapping and adjacent (start, end) intervals into a sorted list."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def index_events(events, start=None, end=None):
+    """
+    Group events by date in a single pass, so calendar cells can look up
+    their events instead of scanning the whole list.
+    Returns {date: [color, ...]} with one entry per event of that day.
+
+    For an event queryset only the date and colour of one-off events are
+    read; repeating series are loaded and expanded from start to end.
+    Other iterables are taken to hold occurrences already.
+    """
+    if hasattr(events, 'values_list'):
+        one_off = events\
+            .filter(repeat='none')\
+            .order_by('date', F('start').asc(nulls_first=True))\
+            .values_list('date', 'start', 'color')
+        series = events\
+            .exclude(repeat='none')\
+            .only('date', 'start', 'color', 'repeat', 'repeat_interval', 'repeat_until')
+        rows = heapq.merge(
+            one_off,
+            ((o.date, o.start, o.color) for o in expand_occurrences(series, start, end)),
+            key=lambda row: (row[0], row[1] or datetime.time.min)
+        )
+    else:
+        rows = ((e.date, e.start, e.color) for e in events)
+
+    index = {}
+    for date, _, color in rows:
+        index.setdefault(date, []).append(color)
+    return index
+
+
+class EventHTMLCalendar(calendar.HTMLCalendar):
+    event_color = "red"
+
+    def __init__(self, events, *args, start=None, end=None, **kwargs):
+        super(EventHTMLCalendar, self).__init__(*args, **kwargs)
+        self.events = index_events(events, start, end)
+        self.events_url = reverse('cal:m_calendar_events_list')
+        self.current_date = datetime.date(1, 1, 1)
+
+    def formatday(self, day, weekday):
+        if day == 0:
+            return '<td class="%s">&nbsp;</td>' % self.cssclass_noday
+
+        self.current_date = self.current_date.replace(day=day)
+        colors = self.events.get(self.current_date, [])
+        if colors:
+            style = f'color: {colors[0] or self.event_color}'
+            title = f'{len(colors)} event{"s" if len(colors) > 1 else ""}'
+        else:
+            style = ''
+            title = ''
+
+        return f'''
+            <td class="{self.cssclasses[weekday]}">
+                <a href="{self.events_url}{create_url_from_date(self.current_date)}">
+                    <span style="{style}" title="{title}">{day}</span>
+                </a>
+            </td>
+            '''
+
+
+class YearCustomHTMLCal(EventHTMLCalendar):
     cssclasses = [style + " center aligned" for style in
                   calendar.HTMLCalendar.cssclasses]
     cssclass_month_head = "center aligned"
     cssclass_year_head = "center aligned"
     cssclass_year = "ui table"
-    
-    def __init__(self, events, *args, **kwargs):
-        super(YearCustomHTMLCal, self).__init__(*args, **kwargs)
-        self.events = events
-        self.current_date = datetime.date(1, 1, 1)
 
     def formatyear(self, theyear, width=3):
         v = []
@@ -46,7 +178,7 @@ class YearCustomHTMLCal(calendar.HTMLCalendar):
         return f'''
         <tr>
             <th colspan="7" class="{self.cssclass_month_head}">
-                <a href="{reverse('cal:m_calendar_events_list')}?year={theyear}&month={themonth}">{s}</a>
+                <a href="{self.events_url}?year={theyear}&month={themonth}">{s}</a>
             </th>
         </tr>
         '''
@@ -56,48 +188,19 @@ class YearCustomHTMLCal(calendar.HTMLCalendar):
         result = super().formatmonth(year, month, withyear)
         return result
 
-    def formatday(self, day, weekday):
-        self.current_date = datetime.date(
-                                self.current_date.year,
-                                self.current_date.month, 
-                                day if day != 0 else 1
-                            )
-                            
-        if day == 0:
-            return '<td class="%s">&nbsp;</td>' % self.cssclass_noday
-        else:
-            event = False
-            for e in self.events:
-                if e.date == self.current_date:
-                    event = True
-                    break
-
-            return f'''
-            <td class="{self.cssclasses[weekday]}">
-                <a href="{reverse('cal:m_calendar_events_list')}{create_url_from_date(self.current_date)}">
-                    <span style="color: {"red" if event else ""}">{day}</span>
-                </a>
-            </td>
-            '''
 
-
-class MonthCustomHTMLCal(calendar.HTMLCalendar):
+class MonthCustomHTMLCal(EventHTMLCalendar):
     cssclasses = [style + "center aligned" for style in
                   calendar.HTMLCalendar.cssclasses]
     cssclass_month_head = "center aligned"
     cssclass_month = "ui celled fixed table"
     cssclasses_weekday_head = ["center aligned" for _ in calendar.HTMLCalendar.cssclasses_weekday_head]
 
-    def __init__(self, events, *args, **kwargs):
-        super(MonthCustomHTMLCal, self).__init__(*args, **kwargs)
-        self.events = events
-        self.current_date = datetime.date(1, 1, 1)
-
     def formatmonthname(self, theyear, themonth, withyear=True):
         if withyear:
             s = f'''
                 {calendar.month_name[themonth]}
-                <a href="{reverse('cal:m_calendar_events_list')}?year={theyear}">
+                <a href="{self.events_url}?year={theyear}">
                      {theyear}
                 </a>
             '''
@@ -110,13 +213,13 @@ class MonthCustomHTMLCal(calendar.HTMLCalendar):
         return f'''
         <tr>
             <th colspan="2" class="{self.cssclass_month_head}">
-                <a href="{reverse('cal:m_calendar_events_list')}?year={prev_year}&month={prev_month}">{calendar.month_name[prev_month]}</a>
+                <a href="{self.events_url}?year={prev_year}&month={prev_month}">{calendar.month_name[prev_month]}</a>
             </th>
             <th colspan="3" class="{self.cssclass_month_head}">
                 {s}
             </th>
             <th colspan="2" class="{self.cssclass_month_head}">
-                <a href="{reverse('cal:m_calendar_events_list')}?year={next_year}&month={next_month}">{calendar.month_name[next_month]}</a>
+                <a href="{self.events_url}?year={next_year}&month={next_month}">{calendar.month_name[next_month]}</a>
             </th>
         </tr>
         '''
@@ -146,29 +249,6 @@ class MonthCustomHTMLCal(calendar.HTMLCalendar):
         a('\n')
         return ''.join(v)
 
-    def formatday(self, day, weekday):
-        self.current_date = datetime.date(
-            self.current_date.year,
-            self.current_date.month,
-            day if day != 0 else 1
-        )
-
-        if day == 0:
-            return '<td class="%s">&nbsp;</td>' % self.cssclass_noday
-        else:
-            event = False
-            for e in self.events:
-                if e.date == self.current_date:
-                    event = True
-                    break
-
-            return f'''
-            <td class="{self.cssclasses[weekday]}">
-                <a href="{reverse('cal:m_calendar_events_list')}{create_url_from_date(self.current_date)}">
-                    <span style="color: {"red" if event else ""}">{day}</span>
-                </a>
-            </td>
-            '''
 
 
 def create_url_from_date(date):
@@ -187,19 +267,49 @@ def create_url_get_args(args):
     return get_attrs[:-1]
 
 
-def random_string_generator(length=10):
-    chars = string.ascii_lowercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+SHARE_TOKEN_BYTES = 24  # 32 url-safe characters
 
 
-def token_generator(instance, new_token=None):
-    if new_token:
-        token = new_token
-    else:
-        token = random_string_generator()
-    klass = instance.__class__
-    qs = klass.objects.filter(token=token)
-    if qs.exists():
-        new_token = f'{token}{random_string_generator(2)}'
-        return token_generator(instance, new_token)
-    return token
+def share_token_generator():
+    return secrets.token_urlsafe(SHARE_TOKEN_BYTES)
+
+
+def calendar_version_key(calendar_id):
+    return f'cal:calendar:{calendar_id}:version'
+
+
+def get_calendar_versions(calendar_ids):
+    """
+    Return sorted (calendar_id, version) pairs. Missing versions are seeded
+    with the current time, so an expired counter never comes back as a value
+    that was already used for cached fragments.
+    """
+    keys = {calendar_version_key(pk): pk for pk in calendar_ids}
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, CALENDAR_VERSION_TIMEOUT)
+        versions.update(missing)
+    return sorted((keys[key], version) for key, version in versions.items())
+
+
+def bump_calendar_version(calendar_id):
+    key = calendar_version_key(calendar_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), CALENDAR_VERSION_TIMEOUT)
+
+
+def visible_calendars_key(user_id):
+    return f'cal:user:{user_id}:calendars'
+
+
+def invalidate_visible_calendars(user_ids):
+    cache.delete_many([visible_calendars_key(pk) for pk in user_ids])
+
+
+def calendar_fragment_key(name, calendar_ids, *args):
+    versions = get_calendar_versions(calendar_ids)
+    digest = hashlib.md5(repr((versions, args)).encode()).hexdigest()
+    return f'cal:fragment:{name}:{digest}'
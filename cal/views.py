@@ -1,8 +1,12 @@
 import calendar
 import datetime
+import hashlib
 
 from django.shortcuts import render, reverse, get_object_or_404, redirect, Http404
-from django.core.exceptions import PermissionDenied
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth import get_user_model
 from django.views.generic import (
@@ -12,11 +16,15 @@ from django.views.generic import (
     UpdateView,
     DeleteView,
     TemplateView,
+    FormView,
     View
 )
 
 from .models import Calendar, Event, CalendarShareToken
-from .utils import create_url_from_date
+from .forms import EventImportForm
+from .importers import import_events, read_rows
+from .utils import create_url_from_date, expand_occurrences
+from . import ics
 
 User = get_user_model()
 
@@ -87,78 +95,71 @@ class CalendarDeleteSuccessView(LoginRequiredMixin, TemplateView):
 class CalendarEventsView(LoginRequiredMixin, ListView):
     model = Event
 
-    def get_queryset(self):
-        pk = self.kwargs.get('pk') or None
-        if pk is not None:
-            qs = Event.objects.by_calendar(self.request, self.kwargs['pk'])
-        else:
-            qs = Event.objects.available(self.request)
-        print(qs)
-        fill = True
-        now = datetime.datetime.now()
-
-        day = self.request.GET.get('day') or None
-        try:
-            day = int(day)
-            if not 1 <= day <= 31:
-                day = None
-        except ValueError:
-            day = None
-        except TypeError:
-            day = None
-
-        month = self.request.GET.get('month') or None
-        try:
-            month = int(month)
-            if not 1 <= month <= 12:
-                month = None
-        except ValueError:
-            month = None
-        except TypeError:
-            day = None
-
-        if month is None and day is not None and fill:
-            month = now.month
-        elif month is None and day is not None:
-            month = now.month  # default
-            day = None  # default
-
-        year = self.request.GET.get('year') or None
+    def get_int_arg(self, name, low=None, high=None):
         try:
-            year = int(year)
-        except ValueError:
-            year = None
-        except TypeError:
-            day = None
+            value = int(self.request.GET.get(name))
+        except (TypeError, ValueError):
+            return None
+        if low is not None and not low <= value <= high:
+            return None
+        return value
+
+    def get_date_range(self):
+        now = datetime.datetime.now()
+        year = self.get_int_arg('year', datetime.MINYEAR, datetime.MAXYEAR)
+        month = self.get_int_arg('month', 1, 12)
+        day = self.get_int_arg('day', 1, 31)
 
         if year is None and month is None and day is None:
-            year = now.year  # default
             month = now.month  # default
-            day = None  # default
-        if year is None and fill:
+        if month is None and day is not None:
+            month = now.month
+        if year is None:
             year = now.year
-        elif year is None:
-            year = now.year  # default
-            month = now.month  # default
-            day = None  # default
+
+        if day is not None and day > calendar.monthrange(year, month)[1]:
+            day = None
 
         self.kwargs['year'] = year
         self.kwargs['month'] = month
         self.kwargs['day'] = day
 
-        qs = qs.filter(date__year=year) if year is not None else qs
-        qs = qs.filter(date__month=month) if month is not None else qs
-        qs = qs.filter(date__day=day) if day is not None else qs
-        qs = qs.order_by('date__day')
-        # .annotate(day=ExtractDay('date'))#.values('day', 'name').annotate(c=Count('day')).order_by()
+        if day is not None:
+            start = end = datetime.date(year, month, day)
+        elif month is not None:
+            start = datetime.date(year, month, 1)
+            end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+        else:
+            start = datetime.date(year, 1, 1)
+            end = datetime.date(year, 12, 31)
+        return start, end
+
+    def get_queryset(self):
+        pk = self.kwargs.get('pk') or None
+        start, end = self.start, self.end = self.get_date_range()
 
+        visible_ids = Calendar.objects.visible_ids(self.request.user)
+        if pk is not None:
+            self.calendar_ids = [pk] if pk in visible_ids else []
+        else:
+            self.calendar_ids = visible_ids
+
+        qs = Event.objects.between(self.request, start, end, calendar_id=pk)
+        if self.kwargs['day'] is not None:
+            qs = qs.with_guest_counts()
         return qs
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
+        if self.kwargs['day'] is not None:
+            # the day list shows every occurrence, expanded as it is rendered
+            context['object_list'] = expand_occurrences(self.object_list, self.start, self.end)
+        # month and year grids get the queryset and read it only when the
+        # cached grid is missing
         context['year'] = self.kwargs['year']
         context['month'] = self.kwargs['month']
         context['day'] = self.kwargs['day']
+        context['calendar_ids'] = self.calendar_ids
         if self.kwargs['month']:
             context['days_list'] = calendar.monthcalendar(self.kwargs['year'], self.kwargs['month'])
 
@@ -179,7 +180,8 @@ class CalendarEventsView(LoginRequiredMixin, ListView):
 
 class CalendarEventCreateView(LoginRequiredMixin, CreateView):
     model = Event
-    fields = ['name', 'body', 'color', 'date', 'start', 'end', 'whole_day', 'place', 'calendar']
+    fields = ['name', 'body', 'color', 'date', 'start', 'end', 'whole_day', 'place', 'calendar',
+              'repeat', 'repeat_interval', 'repeat_until']
     template_name = 'cal/events/create.html'
 
     def get_initial(self):
@@ -200,7 +202,8 @@ class CalendarEventCreateView(LoginRequiredMixin, CreateView):
 
 
 class EventUpdateView(LoginRequiredMixin, UpdateView):
-    fields = ['name', 'body', 'color', 'date', 'start', 'end', 'whole_day', 'place', 'calendar']
+    fields = ['name', 'body', 'color', 'date', 'start', 'end', 'whole_day', 'place', 'calendar',
+              'repeat', 'repeat_interval', 'repeat_until']
     template_name = 'cal/events/edit.html'
 
     def get_queryset(self):
@@ -230,7 +233,8 @@ class EventDetailView(LoginRequiredMixin, DetailView):
 
 class EventCreateView(LoginRequiredMixin, CreateView):
     model = Event
-    fields = ['name', 'body', 'color', 'date', 'start', 'end', 'whole_day', 'place', 'calendar']
+    fields = ['name', 'body', 'color', 'date', 'start', 'end', 'whole_day', 'place', 'calendar',
+              'repeat', 'repeat_interval', 'repeat_until']
     template_name = 'cal/events/create.html'
 
     def get_success_url(self):
@@ -245,77 +249,136 @@ class EventCreateView(LoginRequiredMixin, CreateView):
             raise PermissionDenied()
 
 
+class CalendarImportView(LoginRequiredMixin, FormView):
+    template_name = 'cal/import.html'
+    form_class = EventImportForm
+
+    def get_calendar(self):
+        return get_object_or_404(Calendar.objects.owned(self.request), pk=self.kwargs['pk'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['object'] = self.get_calendar()
+        return context
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        rows = read_rows(upload.file, upload.name)
+        try:
+            result = import_events(self.get_calendar(), self.request.user, rows)
+        except ValidationError as e:
+            # nothing is imported from a file that can't be read to the end
+            form.add_error('file', e)
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
 class CalendarShareView(LoginRequiredMixin, View):
     template_name = 'cal/share.html'
 
     def get(self, request, *args, **kwargs):
         cal = get_object_or_404(Calendar, pk=self.kwargs['pk'])
-        token = CalendarShareToken.objects.filter(calendar=cal)
+        token = CalendarShareToken.objects.filter(calendar=cal).first()
         context = {}
-        if token.exists():
-            if token.first().active:
-                context['token'] = token.first()
-                context['token_link'] = token.first().get_url(request)
+        if token is not None and token.active:
+            context['token'] = token
+            context['token_link'] = token.get_url(request)
+            context['feed_link'] = token.get_feed_url(request)
         return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         cal = get_object_or_404(Calendar, pk=self.kwargs['pk'])
-        token_qs = CalendarShareToken.objects.filter(calendar=cal)
+        token = CalendarShareToken.objects.filter(calendar=cal).first()
 
-        if not token_qs.exists():
+        if token is None:
             token = CalendarShareToken.objects.create(calendar=cal, active=True)
-            token.save()
         else:
-            token = token_qs.first()
             t = request.POST.get('token') or None
             if t is not None:
-                if t == token.token:
-                    if token.active:
-                        token.active = False
-                        token.save()
-                    token = None
-                else:
-                    token = None
-            else:
-                if not token.active:
-                    token.active = True
-                    token.save()
+                if t == token.token and token.active:
+                    token.active = False
+                    token.save(update_fields=['active'])
+                token = None
+            elif not token.active:
+                # re-enabled links get a new token, old links stay dead
+                token.active = True
+                token.rotate()
         context = {
             'token': token
         }
         if token:
             context['token_link'] = token.get_url(request)
+            context['feed_link'] = token.get_feed_url(request)
         return render(request, self.template_name, context)
 
 
 class ShareLinkView(LoginRequiredMixin, View):
     template_name = 'cal/subscribe.html'
 
+    def get_token(self):
+        token = CalendarShareToken.objects.lookup(self.kwargs.get('token'))
+        if token is None:
+            raise Http404("Calendar not found")
+        return token
+
+    def is_visible(self, cal):
+        return cal.pk in Calendar.objects.visible_ids(self.request.user)
+
     def get(self, request, *args, **kwargs):
-        t = self.kwargs.get('token')
-        token = CalendarShareToken.objects.get(token=t)
+        token = self.get_token()
         cal = token.calendar
-        if request.user in cal.subscribers.all() or request.user == cal.owner:
+        if self.is_visible(cal):
             return redirect(reverse('cal:calendar_events_list', kwargs={'pk': cal.id}))
-        else:
-            if token.active:
-                return render(request, self.template_name, {'object': cal})
+        if token.active:
+            return render(request, self.template_name, {'object': cal})
         raise Http404("Calendar not found")
 
     def post(self, request, *args, **kwargs):
-        t = self.kwargs.get('token')
-        token = CalendarShareToken.objects.get(token=t)
-
+        token = self.get_token()
         cal = token.calendar
-        if request.user in cal.subscribers.all() or request.user == cal.owner:
+        if self.is_visible(cal):
+            return redirect(reverse('cal:calendar_events_list', kwargs={'pk': cal.id}))
+        if token.active:
+            cal.subscribers.add(request.user)
             return redirect(reverse('cal:calendar_events_list', kwargs={'pk': cal.id}))
-        else:
-            if token.active:
-                cal.subscribers.add(request.user)
-                return redirect(reverse('cal:calendar_events_list', kwargs={'pk': cal.id}))
         raise Http404("Calendar not found")
 
 
+class CalendarFeedView(View):
+    """
+    iCalendar feed of a shared calendar, authenticated by its share token.
+    The body is streamed. ETag and Last-Modified come from Calendar.updated,
+    which every change of the calendar or its events moves, so clients
+    polling with either get a 304 after the token lookup alone.
+    """
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        token = CalendarShareToken.objects.lookup(self.kwargs.get('token'), active_only=True)
+        if token is None:
+            raise Http404("Calendar not found")
+
+        cal = token.calendar
+        events = Event.objects.filter(calendar=cal)
+
+        last_modified = int(cal.updated.timestamp())
+        version = f'{cal.pk}:{cal.updated.isoformat()}'
+        etag = quote_etag(hashlib.md5(version.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+
+        response = StreamingHttpResponse(
+            ics.iter_calendar(cal, events.iterator(chunk_size=self.chunk_size), request.get_host()),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+        return response
+
+
 class CalendarRemoveSubscriberView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         user_id = request.POST.get('user_id')
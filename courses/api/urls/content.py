@@ -6,7 +6,8 @@ from ..views import (
     TextContentViewSet,
     ImageContentViewSet,
     VideoContentViewSet,
-    FileContentViewSet
+    FileContentViewSet,
+    UploadSessionViewSet
 )
 
 router = routers.DefaultRouter()
@@ -14,6 +15,7 @@ router.register('text', TextContentViewSet, basename="text")
 router.register('image', ImageContentViewSet, basename="image")
 router.register('video', VideoContentViewSet, basename="video")
 router.register('file', FileContentViewSet, basename="file")
+router.register('uploads', UploadSessionViewSet, basename="upload")
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,12 +1,13 @@
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
 
 from rest_framework import viewsets
 from rest_framework import permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework import status, generics
+from rest_framework import status, generics, mixins
 
 from ..serializers import (
     SnippetCourseSerializer,
@@ -15,15 +16,19 @@ from ..serializers import (
     DetailCategorySerializer,
     CreateCourseSerializer,
     EnrollCourseSerializer,
+    ReorderSerializer,
     ModuleSerializer,
     CreateModuleSerializer,
     SnippetModuleSerializer,
     TextContentSerializer,
     ImageContentSerializer,
     VideoContentSerializer,
-    FileContentSerializer
+    FileContentSerializer,
+    UploadSessionSerializer
 )
-from ..models import Course, Category, Membership, Module, Content
+from ..models import Course, Category, Membership, Module, Content, UploadSession
+from ..uploads import parse_content_range
+from ..tree import get_category_tree
 
 from accounts.permissions import (
     IsAdminStaffOrReadOnly,
@@ -48,7 +53,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     @action(detail=True)
     def subcategories(self, request, *args, **kwargs):
         category = self.get_object()
-        subcategories = category.get_child_categories()
+        subcategories = get_category_tree().get_descendants(category)
 
         serializer = self.get_serializer(subcategories, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -56,7 +61,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     @action(detail=True)
     def tree(self, request, *args, **kwargs):
         category = self.get_object()
-        subcategories = category.get_category_tree()
+        subcategories = get_category_tree().get_ancestors(category)
 
         serializer = self.get_serializer(subcategories, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -131,7 +136,8 @@ class ModuleViewSet(viewsets.ModelViewSet):
         permission_classes = [permissions.IsAuthenticated]
         if self.action in ['list', 'create']:
             permission_classes.append(IsAdminStaffTeacherOrReadOnly)
-        else:
+        elif self.action != 'reorder':
+            # reorder is checked by Course.apply_order, as in the web view
             permission_classes.append(IsAdminStaffOwnerOrReadOnly)
         return [permission() for permission in permission_classes]
 
@@ -169,6 +175,19 @@ class ModuleViewSet(viewsets.ModelViewSet):
         module.move_up()
         return Response({'order': module.order}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['post'])
+    def reorder(self, request, pk=None):
+        """Set the order of all contents of the module at once."""
+        module = self.get_object()
+        serializer = ReorderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        try:
+            module.reorder_contents(request.user, ids)
+        except ValueError as e:
+            return Response({'ids': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'ids': ids}, status=status.HTTP_200_OK)
+
 
 class BaseContentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
@@ -202,7 +221,9 @@ class TextContentViewSet(BaseContentViewSet):
     serializer_class = TextContentSerializer
 
     def get_queryset(self):
-        queryset = Content.objects.get_texts(user=self.request.user)
+        queryset = Content.objects.get_texts(user=self.request.user)\
+            .select_related('owner', 'course__owner')\
+            .with_items()
         return queryset
 
     def get_permissions(self):
@@ -221,7 +242,9 @@ class ImageContentViewSet(viewsets.ModelViewSet):
     serializer_class = ImageContentSerializer
 
     def get_queryset(self):
-        queryset = Content.objects.get_images(user=self.request.user)
+        queryset = Content.objects.get_images(user=self.request.user)\
+            .select_related('owner', 'course__owner')\
+            .with_items()
         return queryset
 
     def get_permissions(self):
@@ -237,7 +260,9 @@ class VideoContentViewSet(viewsets.ModelViewSet):
     serializer_class = VideoContentSerializer
 
     def get_queryset(self):
-        queryset = Content.objects.get_videos(user=self.request.user)
+        queryset = Content.objects.get_videos(user=self.request.user)\
+            .select_related('owner', 'course__owner')\
+            .with_items()
         return queryset
 
     def get_permissions(self):
@@ -253,7 +278,9 @@ class FileContentViewSet(viewsets.ModelViewSet):
     serializer_class = FileContentSerializer
 
     def get_queryset(self):
-        queryset = Content.objects.get_files(user=self.request.user)
+        queryset = Content.objects.get_files(user=self.request.user)\
+            .select_related('owner', 'course__owner')\
+            .with_items()
         return queryset
 
     def get_permissions(self):
@@ -264,4 +291,58 @@ class FileContentViewSet(viewsets.ModelViewSet):
             permission_classes.append(IsAdminStaffOwnerOrReadOnly)
         return [permission() for permission in permission_classes]
 
-# Show hide course
\ No newline at end of file
+# Show hide course
+
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet):
+    """
+    Chunked, resumable upload of a File or Image content.
+
+    POST starts a session with the module, kind, title, filename and size.
+    Each chunk is PUT to the session as the raw request body with a
+    Content-Range: bytes first-last/size header, first being the session's
+    offset. GET tells the offset to resume from after a failure. The last
+    chunk creates the content, DELETE abandons the upload.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [
+        permissions.IsAuthenticated,
+        IsAdminStaffTeacherOrReadOnly
+    ]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user).select_related('module')
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.complete:
+            return Response(self.get_serializer(session).data, status=status.HTTP_200_OK)
+        try:
+            first, last, total = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if total != session.size:
+            return Response({'detail': "The total size doesn't match the upload"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            declared = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            declared = 0
+        if request.stream is None or declared < last - first + 1:
+            return Response({'detail': "The body is shorter than the Content-Range"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            accepted = session.write_chunk(first, request.stream, last - first + 1)
+        except ValidationError as e:
+            return Response({'file': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        if not accepted:
+            # the client resumes from the offset in the response
+            session.refresh_from_db()
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        response_status = status.HTTP_201_CREATED if session.complete else status.HTTP_200_OK
+        return Response(self.get_serializer(session).data, status=response_status)
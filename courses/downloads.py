@@ -0,0 +1,190 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from mimetypes import guess_type
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils.http import parse_http_date_safe
+from django.utils.module_loading import import_string
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header, size):
+    """
+    The (first, last) byte positions of a single byte range, or None when the
+    whole file should be sent. Multiple ranges are not supported and are
+    answered with the whole file, which RFC 7233 allows.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last n bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    last = int(last) if last else size - 1
+    return first, min(last, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a Range request may be answered with a part of the current file."""
+    header = request.META.get('HTTP_IF_RANGE')
+    if not header:
+        return True
+    if header.startswith(('"', 'W/')):
+        # If-Range requires a strong comparison, weak tags never match
+        return etag is not None and header == etag
+    return last_modified is not None and parse_http_date_safe(header) == last_modified
+
+
+class RangeFileWrapper:
+    """Reads length bytes of a file from offset, seeking once."""
+
+    def __init__(self, f, offset, length, block_size=64 * 1024):
+        self.f = f
+        self.remaining = length
+        self.block_size = block_size
+        self.f.seek(offset)
+
+    def __iter__(self):
+        while self.remaining > 0:
+            data = self.f.read(min(self.block_size, self.remaining))
+            if not data:
+                break
+            self.remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.f.close()
+
+
+def content_disposition(filename, attachment=True):
+    disposition = 'attachment' if attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return '%s; filename="%s"' % (disposition, filename.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "%s; filename*=utf-8''%s" % (disposition, quote(filename))
+
+
+class DownloadBackend(ABC):
+    """Sends a file stored under PROTECTED_ROOT to a user allowed to read it."""
+
+    def get_relative_path(self, path):
+        root = os.path.realpath(settings.PROTECTED_ROOT)
+        path = os.path.realpath(path)
+        if os.path.commonpath([root, path]) != root:
+            raise Http404("File doesn't exist")
+        return os.path.relpath(path, root)
+
+    def get_content_type(self, path, filename=None):
+        # content addressed blobs have no extension, the download name has
+        return guess_type(filename or path)[0] or 'application/octet-stream'
+
+    @abstractmethod
+    def serve(self, request, path, filename, use_range=True, attachment=True):
+        """
+        use_range is False when an If-Range precondition failed and a
+        Range header must be ignored. attachment=False lets the browser
+        display the file inline.
+        """
+
+
+class DjangoBackend(DownloadBackend):
+    """
+    Streams the file from Django. FileResponse hands the open file to the
+    WSGI server's file_wrapper, which sends it with os.sendfile where the
+    server supports it. A single byte range is read with a seek.
+    """
+
+    def serve(self, request, path, filename, use_range=True, attachment=True):
+        self.get_relative_path(path)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            raise Http404("File doesn't exist")
+        content_type = self.get_content_type(path, filename)
+        size = os.fstat(f.fileno()).st_size
+
+        try:
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size) if use_range else None
+        except RangeNotSatisfiable:
+            f.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+        if byte_range is None:
+            response = FileResponse(f, as_attachment=attachment, filename=filename, content_type=content_type)
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                RangeFileWrapper(f, first, last - first + 1),
+                status=206,
+                content_type=content_type
+            )
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+            response['Content-Disposition'] = content_disposition(filename, attachment)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class NginxBackend(DownloadBackend):
+    """
+    Lets nginx send the file with X-Accel-Redirect. PROTECTED_URL must be an
+    internal location aliased to PROTECTED_ROOT.
+    """
+
+    def serve(self, request, path, filename, use_range=True, attachment=True):
+        response = HttpResponse(content_type=self.get_content_type(path, filename))
+        response['X-Accel-Redirect'] = settings.PROTECTED_URL + quote(self.get_relative_path(path))
+        response['Content-Disposition'] = content_disposition(filename, attachment)
+        return response
+
+
+class ApacheBackend(DownloadBackend):
+    """Lets Apache mod_xsendfile send the file, PROTECTED_ROOT must be allowed by XSendFilePath."""
+
+    def serve(self, request, path, filename, use_range=True, attachment=True):
+        self.get_relative_path(path)
+        response = HttpResponse(content_type=self.get_content_type(path, filename))
+        # mod_xsendfile unescapes the header by default
+        response['X-Sendfile'] = quote(path)
+        response['Content-Disposition'] = content_disposition(filename, attachment)
+        return response
+
+
+BACKENDS = {
+    'django': DjangoBackend,
+    'nginx': NginxBackend,
+    'apache': ApacheBackend,
+}
+
+
+def get_download_backend():
+    """PROTECTED_FILE_BACKEND is one of BACKENDS or the dotted path of a DownloadBackend."""
+    name = getattr(settings, 'PROTECTED_FILE_BACKEND', 'django')
+    backend = BACKENDS.get(name) or import_string(name)
+    return backend()
+
+
+def serve_protected_file(request, path, filename, use_range=True, attachment=True):
+    return get_download_backend().serve(request, path, filename, use_range=use_range, attachment=attachment)
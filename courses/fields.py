@@ -1,24 +1,142 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
+from django.db.models import F, Max, Min
+
 
 class OrderField(models.PositiveIntegerField):
+    """
+    Position of an object among the objects sharing for_fields. Values may
+    have gaps; only their relative order matters.
+    """
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super(OrderField, self).__init__(*args, **kwargs)
 
+    def get_scope(self, model_instance):
+        return {field: getattr(model_instance, field) for field in self.for_fields or []}
+
+    def get_scope_queryset(self, model_instance):
+        return self.model._default_manager.filter(**self.get_scope(model_instance)).order_by()
+
+    def lock_scope(self, model_instance):
+        """
+        Lock the parent rows of the scope (e.g. the module of a content), so
+        concurrent inserts and moves within it run one after another.
+        Must be called inside a transaction.
+        """
+        for name in self.for_fields or []:
+            field = self.model._meta.get_field(name)
+            value = getattr(model_instance, field.attname)
+            if field.is_relation and value is not None:
+                list(field.related_model._default_manager
+                     .select_for_update()
+                     .filter(pk=value)
+                     .values_list('pk'))
+
+    def get_next_value(self, model_instance):
+        last = self.get_scope_queryset(model_instance).aggregate(last=Max(self.attname))['last']
+        return (last or 0) + 1
+
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
             # brak wartości
-            try:
-                qs=self.model.objects.all()
-                if self.for_fields:
-                    query = {field: getattr(model_instance, field) for field in self.for_fields}
-                    qs = qs.filter(**query)
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 1
+            if transaction.get_connection().in_atomic_block:
+                self.lock_scope(model_instance)
+            value = self.get_next_value(model_instance)
             setattr(model_instance, self.attname, value)
             return value
         else:
-            return super(OrderField, self).pre_save(model_instance, add)
\ No newline at end of file
+            return super(OrderField, self).pre_save(model_instance, add)
+
+
+def get_order_field(model, field_name='order'):
+    return model._meta.get_field(field_name)
+
+
+def assign_order(objs, field_name='order'):
+    """
+    Append unsaved objects to the end of their scopes before bulk_create,
+    reading the last position once per scope. Call it in the transaction
+    that creates the objects, the scopes stay locked until it ends.
+    """
+    if not objs:
+        return objs
+    field = get_order_field(type(objs[0]), field_name)
+    next_values = {}
+    with transaction.atomic():
+        for obj in objs:
+            if getattr(obj, field.attname) is not None:
+                continue
+            scope = tuple(sorted(field.get_scope(obj).items(), key=lambda item: item[0]))
+            if scope not in next_values:
+                field.lock_scope(obj)
+                next_values[scope] = field.get_next_value(obj)
+            setattr(obj, field.attname, next_values[scope])
+            next_values[scope] += 1
+    return objs
+
+
+def move_to(instance, position, field_name='order'):
+    """
+    Move the instance to the given position within its scope. Objects in
+    between are shifted by one with a single range UPDATE.
+    """
+    field = get_order_field(type(instance), field_name)
+    name = field.attname
+    with transaction.atomic():
+        field.lock_scope(instance)
+        qs = field.get_scope_queryset(instance)
+        bounds = qs.aggregate(first=Min(name), last=Max(name))
+        current = qs.filter(pk=instance.pk).values_list(name, flat=True).get()
+        position = max(min(position, bounds['last']), bounds['first'], 1)
+
+        if position < current:
+            qs.filter(**{f'{name}__gte': position, f'{name}__lt': current}).update(**{name: F(name) + 1})
+        elif position > current:
+            qs.filter(**{f'{name}__gt': current, f'{name}__lte': position}).update(**{name: F(name) - 1})
+        if position != current:
+            qs.filter(pk=instance.pk).update(**{name: position})
+    setattr(instance, name, position)
+    return position
+
+
+def move_to_neighbour(instance, step, field_name='order'):
+    """Swap places with the previous (step < 0) or the next (step > 0) object."""
+    field = get_order_field(type(instance), field_name)
+    name = field.attname
+    with transaction.atomic():
+        # the position is read again under the lock, the instance may be stale
+        field.lock_scope(instance)
+        qs = field.get_scope_queryset(instance)
+        current = qs.filter(pk=instance.pk).values_list(name, flat=True).get()
+        if step < 0:
+            neighbour = qs.filter(**{f'{name}__lt': current}).aggregate(value=Max(name))['value']
+        else:
+            neighbour = qs.filter(**{f'{name}__gt': current}).aggregate(value=Min(name))['value']
+        if neighbour is None:
+            setattr(instance, name, current)
+            return current
+        return move_to(instance, neighbour, field_name)
+
+
+def reorder(queryset, ordered_ids, field_name='order'):
+    """
+    Number the objects of the queryset 1..n in the order of ordered_ids with
+    a single bulk_update. ordered_ids must list every object exactly once.
+    """
+    field = get_order_field(queryset.model, field_name)
+    name = field.attname
+    # scope fields are loaded too, related managers read them on every row
+    fields = ['pk', name, *(field.for_fields or [])]
+    with transaction.atomic():
+        objs = {obj.pk: obj for obj in queryset.select_for_update().only(*fields)}
+        if len(ordered_ids) != len(objs) or set(ordered_ids) != set(objs):
+            raise ValueError("The ordering must list every object exactly once")
+
+        changed = []
+        for position, pk in enumerate(ordered_ids, start=1):
+            obj = objs[pk]
+            if getattr(obj, name) != position:
+                setattr(obj, name, position)
+                changed.append(obj)
+        queryset.model._default_manager.bulk_update(changed, [name])
+    return ordered_ids
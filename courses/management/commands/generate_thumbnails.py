@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from courses.models import Image
+from courses.tasks import generate_image_thumbnails
+from accounts.tasks import generate_photo_thumbnails
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Queue thumbnail generation for images and user photos that have no current thumbnails"
+
+    def handle(self, *args, **options):
+        queued = 0
+        for image in Image.objects.only('id', 'file', 'thumbnails_for').iterator():
+            if image.thumbnails_outdated():
+                generate_image_thumbnails.delay(image.id)
+                queued += 1
+        for user in User.objects.exclude(photo='').exclude(photo=None).only('id', 'photo', 'thumbnails_for').iterator():
+            if user.thumbnails_outdated():
+                generate_photo_thumbnails.delay(user.id)
+                queued += 1
+        self.stdout.write(self.style.SUCCESS("Queued %s thumbnail jobs" % queued))
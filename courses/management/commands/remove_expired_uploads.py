@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from courses.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Remove chunked uploads that were not finished and their part files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help="Age of the last chunk, 24 hours by default")
+
+    def handle(self, *args, **options):
+        deleted, _ = UploadSession.objects.expired(timedelta(hours=options['hours'])).delete()
+        self.stdout.write(self.style.SUCCESS("Removed %s expired uploads" % deleted))
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_contents(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Content = apps.get_model('courses', 'Content')
+    counters = {
+        'text': 'text_count',
+        'image': 'image_count',
+        'file': 'file_count',
+        'video': 'video_count'
+    }
+    counts = Content.objects\
+        .values('course_id', 'content_type__model')\
+        .annotate(total=Count('id'))\
+        .order_by()
+    courses = {}
+    for row in counts:
+        counter = counters.get(row['content_type__model'])
+        if counter is not None:
+            courses.setdefault(row['course_id'], {})[counter] = row['total']
+    for course_id, values in courses.items():
+        Course.objects.filter(pk=course_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_auto_20210308_1114'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='text_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='video_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_contents, migrations.RunPython.noop),
+    ]
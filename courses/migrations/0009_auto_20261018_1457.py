@@ -0,0 +1,36 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    Category = apps.get_model('courses', 'Category')
+    categories = list(Category.objects.all())
+    parents = {category.pk: category.parent_category_id for category in categories}
+    paths = {}
+
+    def get_path(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (get_path(parent_id) if parent_id else '') + f'{pk}/'
+        return paths[pk]
+
+    for category in categories:
+        category.path = get_path(category.pk)
+    Category.objects.bulk_update(categories, ['path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_auto_20261018_1456'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.7 on 2026-10-18 15:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_courses(apps, schema_editor):
+    Category = apps.get_model('courses', 'Category')
+    Course = apps.get_model('courses', 'Course')
+    counts = dict(
+        Course.objects
+        .exclude(category=None)
+        .values_list('category')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    parents = set(
+        Category.objects
+        .exclude(parent_category=None)
+        .values_list('parent_category', flat=True)
+    )
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.course_count = counts.get(category.pk, 0)
+        category.used = category.course_count > 0 or category.pk in parents
+    Category.objects.bulk_update(categories, ['course_count', 'used'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_auto_20261018_1457'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='course_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='used',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(count_courses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.1.7 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+
+def fill_summaries(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Content = apps.get_model('courses', 'Content')
+    for kind in ('text', 'image', 'file', 'video'):
+        content_type = ContentType.objects.filter(app_label='courses', model=kind).first()
+        if content_type is None:
+            continue
+        Item = apps.get_model('courses', kind)
+        items = Item.objects.in_bulk()
+        contents = list(Content.objects.filter(content_type=content_type))
+        for content in contents:
+            item = items.get(content.object_id)
+            content.kind = kind
+            if item is None:
+                continue
+            content.title = item.title
+            content.created = item.created
+            content.updated = item.updated
+            if kind in ('image', 'file'):
+                try:
+                    content.size = item.file.size
+                except (OSError, ValueError):
+                    content.size = None
+        Content.objects.bulk_update(
+            contents, ['kind', 'title', 'created', 'updated', 'size'], batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('courses', '0010_auto_20261018_1500'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='created',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='kind',
+            field=models.CharField(blank=True, choices=[('text', 'Text'), ('image', 'Image'), ('file', 'File'), ('video', 'Video')], editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='title',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='updated',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_auto_20261018_1506'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='thumbnails_for',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
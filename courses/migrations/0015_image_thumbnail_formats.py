@@ -0,0 +1,25 @@
+# Generated by Django 3.1.7 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+def fill_thumbnail_formats(apps, schema_editor):
+    # the formats of existing thumbnails weren't recorded, JPEG is always written
+    Image = apps.get_model('courses', 'Image')
+    Image.objects.exclude(thumbnails_for='').update(thumbnail_formats='jpeg')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail_formats',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_thumbnail_formats, migrations.RunPython.noop),
+    ]
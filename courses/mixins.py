@@ -1,4 +1,5 @@
-from django.shortcuts import redirect
+from django.shortcuts import redirect, get_object_or_404
+from django.http import Http404
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.core.cache import caches
@@ -18,6 +19,41 @@ class IsTeacherMixin:
             return redirect('/')
 
 
+class ManageCourseMixin:
+    """
+    Resolves the course from the url slug once per request and checks the
+    user's rights to it. permission names a CourseAdmin flag, None lets in
+    any course admin.
+    """
+    permission = 'can_edit_content'
+    course_slug_url_kwarg = 'slug'
+
+    def get_course_queryset(self):
+        return Course.objects.all()
+
+    def get_course(self):
+        if not hasattr(self, '_course'):
+            slug = self.kwargs.get(self.course_slug_url_kwarg)
+            course = get_object_or_404(self.get_course_queryset(), slug=slug)
+            if not course.has_permission(self.request.user, self.permission):
+                raise Http404("Course does not exist")
+            self._course = course
+        return self._course
+
+    def get_object(self, queryset=None):
+        return self.get_course()
+
+
+class CachedObjectMixin:
+    """Looks the object up once per request however often get_object is called."""
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+
 # classes for path mixin
 class PathText:
     def __init__(self, text):
@@ -1,43 +1,98 @@
-from django.db import models
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.conf import settings 
-from django.core.files.storage import FileSystemStorage
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.shortcuts import reverse
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q
-
-from .utils import slug_generator, get_filename
-from .fields import OrderField
+from django.db.models import F, Q, Value, Count, Max, Case, When, Exists, OuterRef, Subquery, Prefetch
+from django.db.models.functions import Coalesce, Concat, Substr, Length
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.cache import cache
+from django.utils import timezone
+
+from .utils import (
+    slug_generator,
+    get_filename,
+    bump_category_tree_version,
+    course_access_key,
+    invalidate_course_access,
+    COURSE_ACCESS_TIMEOUT
+)
+from .fields import OrderField, move_to, move_to_neighbour, reorder
+from .thumbnails import ThumbnailsMixin, THUMBNAIL_SIZES, delete_thumbnails
+from .storage import ContentAddressedStorage, get_digest
+from .uploads import write_chunk, verify_image, move_into_storage, get_part_path, remove_part
 from courses import tasks
 
 User = settings.AUTH_USER_MODEL
 
 
+class MaintainedFieldsMixin:
+    """
+    Leaves maintained_fields out of updates, so saving an instance loaded
+    earlier doesn't overwrite counters kept up to date with UPDATEs.
+    """
+    maintained_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.maintained_fields
+            ]
+        return super().save(*args, **kwargs)
+
+
+def contents_prefetch(items=True):
+    """Modules of a course with their contents and, optionally, the content items."""
+    queryset = Content.objects.with_items() if items else Content.objects.all()
+    return Prefetch('module_set__content_set', queryset=queryset)
+
+
+# the owner has every right, course admins those granted to them
+CoursePermissions = namedtuple(
+    'CoursePermissions',
+    ['can_manage', 'can_edit_course', 'can_edit_content', 'can_edit_participants']
+)
+
+
 class CourseQuerySet(models.query.QuerySet):
-    pass
+    def with_contents(self):
+        return self.prefetch_related(contents_prefetch())
 
 
 class CourseManager(models.Manager):
     def get_queryset(self):
         return CourseQuerySet(self.model, self._db)
 
-    def all(self):
-        text_type = ContentType.objects.get_for_model(Text)
-        image_type = ContentType.objects.get_for_model(Image)
-        file_type = ContentType.objects.get_for_model(File)
-        video_type = ContentType.objects.get_for_model(Video)
-        objects = self.get_queryset().all().annotate(
-            texts=Count('module__content', filter=Q(module__content__content_type=text_type)),
-            images=Count('module__content', filter=Q(module__content__content_type=image_type)),
-            files=Count('module__content', filter=Q(module__content__content_type=file_type)),
-            videos=Count('module__content', filter=Q(module__content__content_type=video_type)),
-        )
-        return objects
-
-
-class Course(models.Model):
+    def with_contents(self):
+        return self.get_queryset().with_contents()
+
+    def accessible_ids(self, user):
+        """
+        Ids of courses the user owns, participates in or administers, cached
+        per user for COURSE_ACCESS_TIMEOUT. Saving or deleting a Membership or
+        CourseAdmin (key joins, admin forms), changing participants or
+        admins through the m2m managers (owner adds) and changing the owner
+        invalidate it on commit.
+        """
+        key = course_access_key(user.pk)
+        ids = cache.get(key)
+        if ids is None:
+            owned = self.filter(owner=user).order_by().values_list('id', flat=True)
+            joined = Membership.objects.filter(user=user).order_by().values_list('course_id', flat=True)
+            administered = CourseAdmin.objects.filter(user=user).order_by().values_list('course_id', flat=True)
+            ids = sorted(owned.union(joined, administered))
+            cache.set(key, ids, COURSE_ACCESS_TIMEOUT)
+        return ids
+
+
+class Course(MaintainedFieldsMixin, models.Model):
     title = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
@@ -53,6 +108,12 @@ class Course(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     category = models.ForeignKey("Category", on_delete=models.CASCADE, blank=True, null=True)
 
+    # maintained by Content signal receivers
+    text_count = models.PositiveIntegerField(default=0, editable=False)
+    image_count = models.PositiveIntegerField(default=0, editable=False)
+    file_count = models.PositiveIntegerField(default=0, editable=False)
+    video_count = models.PositiveIntegerField(default=0, editable=False)
+
     participants = models.ManyToManyField(
         User, 
         related_name='courses', 
@@ -62,12 +123,21 @@ class Course(models.Model):
 
     objects = CourseManager()
 
+    maintained_fields = ('text_count', 'image_count', 'file_count', 'video_count')
+
     class Meta:
         ordering = ['title']
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
+
     def get_absolute_url(self):
         return reverse("courses:details", kwargs={"slug": self.slug})
 
@@ -77,32 +147,47 @@ class Course(models.Model):
         else:
             return []
 
+    def get_permissions(self, user):
+        """Rights of the user to this course, loaded once per course instance."""
+        permissions = self.__dict__.setdefault('_permissions_cache', {})
+        if user.pk not in permissions:
+            if user.pk is not None and user.pk == self.owner_id:
+                permissions[user.pk] = CoursePermissions(True, True, True, True)
+            else:
+                rights = CourseAdmin.objects\
+                    .filter(course=self, user_id=user.pk)\
+                    .values_list('can_edit_course', 'can_edit_content', 'can_edit_participants')\
+                    .first()
+                if rights is None:
+                    permissions[user.pk] = CoursePermissions(False, False, False, False)
+                else:
+                    permissions[user.pk] = CoursePermissions(True, *rights)
+        return permissions[user.pk]
+
+    def has_permission(self, user, permission=None):
+        """permission names a CourseAdmin flag, None lets in any course admin."""
+        return getattr(self.get_permissions(user), permission or 'can_manage')
+
     def can_edit_course(self, user):
-        if user == self.owner:
-            return True
-        qs = user.courseadmin_set.filter(course=self)
-        if qs.exists():
-            qs = qs.first()
-            return qs.can_edit_course
-        return False
+        return self.has_permission(user, 'can_edit_course')
 
     def can_edit_content(self, user):
-        if user == self.owner:
-            return True
-        qs = user.courseadmin_set.filter(course=self)
-        if qs.exists():
-            qs = qs.first()
-            return qs.can_edit_content
-        return False
+        return self.has_permission(user, 'can_edit_content')
 
     def can_edit_participants(self, user):
-        if user == self.owner:
-            return True
-        qs = user.courseadmin_set.filter(course=self)
-        if qs.exists():
-            qs = qs.first()
-            return qs.can_edit_participants
-        return False
+        return self.has_permission(user, 'can_edit_participants')
+
+    def apply_order(self, user, queryset, ordered_ids):
+        """
+        Reorder the course's modules or the contents of one of its modules,
+        for users who may edit its content. Shared by the web and API views.
+        """
+        if not self.can_edit_content(user):
+            raise PermissionDenied
+        reorder(queryset, ordered_ids)
+
+    def reorder_modules(self, user, ordered_ids):
+        self.apply_order(user, self.module_set.all(), ordered_ids)
 
 
 def course_pre_save_receiver(sender, instance, *args, **kwargs):
@@ -113,14 +198,42 @@ def course_pre_save_receiver(sender, instance, *args, **kwargs):
 pre_save.connect(course_pre_save_receiver, sender=Course)
 
 
+def course_post_save_receiver(sender, instance, created, *args, **kwargs):
+    # course counts only change with the category
+    loaded_category_id = getattr(instance, '_loaded_category_id', None)
+    if instance.category_id != loaded_category_id:
+        Category.objects.refresh_usage([loaded_category_id, instance.category_id])
+        transaction.on_commit(bump_category_tree_version)
+    instance._loaded_category_id = instance.category_id
+
+
+def course_post_delete_receiver(sender, instance, *args, **kwargs):
+    if instance.category_id is not None:
+        Category.objects.refresh_usage([instance.category_id])
+        transaction.on_commit(bump_category_tree_version)
+
+
+post_save.connect(course_post_save_receiver, sender=Course)
+post_delete.connect(course_post_delete_receiver, sender=Course)
+
+
+def course_owner_changed_receiver(sender, instance, *args, **kwargs):
+    loaded_owner_id = getattr(instance, '_loaded_owner_id', None)
+    if instance.owner_id != loaded_owner_id:
+        user_ids = {instance.owner_id, loaded_owner_id}
+        transaction.on_commit(lambda: invalidate_course_access(user_ids))
+    instance._loaded_owner_id = instance.owner_id
+
+
+post_save.connect(course_owner_changed_receiver, sender=Course)
+
+
 class CategoryQuerySet(models.query.QuerySet):
     def get_root_categories(self):
         return self.filter(parent_category=None)
 
     def get_used_categories(self):
-        return self.exclude(
-            Q(child_categories=None) & Q(course=None)
-        )
+        return self.filter(used=True)
 
 
 class CategoryManager(models.Manager):
@@ -133,8 +246,30 @@ class CategoryManager(models.Manager):
     def get_used_categories(self):
         return self.get_queryset().get_used_categories()
 
+    def refresh_usage(self, category_ids):
+        """
+        Recount courses and recompute the used flag of the given categories
+        with a single UPDATE.
+        """
+        category_ids = {pk for pk in category_ids if pk is not None}
+        if not category_ids:
+            return
+        courses = Course.objects.filter(category=OuterRef('pk'))
+        children = Category.objects.filter(parent_category=OuterRef('pk'))
+        self.get_queryset().filter(pk__in=category_ids).update(
+            course_count=Coalesce(Subquery(
+                courses.order_by().values('category').annotate(total=Count('id')).values('total')
+            ), 0),
+            used=Case(
+                When(Exists(courses), then=Value(True)),
+                When(Exists(children), then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField()
+            )
+        )
+
 
-class Category(models.Model):
+class Category(MaintainedFieldsMixin, models.Model):
     name = models.CharField(max_length=40, unique=True)
     slug = models.SlugField(max_length=50)
     parent_category = models.ForeignKey(
@@ -145,8 +280,16 @@ class Category(models.Model):
         null=True
     )
 
+    # ids from the root down to this category, e.g. "1/4/9/", maintained on save
+    path = models.CharField(max_length=255, db_index=True, blank=True, editable=False)
+    # used: has courses or subcategories, both maintained by refresh_usage()
+    course_count = models.PositiveIntegerField(default=0, editable=False)
+    used = models.BooleanField(default=False, db_index=True, editable=False)
+
     objects = CategoryManager()
 
+    maintained_fields = ('path', 'course_count', 'used')
+
     class Meta:
         ordering = ['name']
         verbose_name = "Category"
@@ -155,30 +298,78 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_category_id = instance.__dict__.get('parent_category_id')
+        return instance
+
     def get_absolute_url(self):
         return reverse("courses:category", kwargs={"slug": self.slug})
 
-    def get_category_tree(self):
-        categories = []
-
-        def parse(category):
-            categories.append(category)
-            if category.parent_category:
-                parse(category.parent_category)
+    def build_path(self):
+        parent_path = self.parent_category.path if self.parent_category_id else ''
+        return f'{parent_path}{self.pk}/'
+
+    def get_ancestor_ids(self):
+        return [int(pk) for pk in self.path.split('/') if pk]
+
+    def check_parent(self, parent):
+        """
+        Raise ValidationError if parent can't hold this category, because it
+        is the category itself or one of its descendants, or because the
+        paths of the subtree would no longer fit in the path column.
+        """
+        if parent is None:
+            return
+        # the parent's path as stored, a loaded instance may be stale
+        parent_path = Category.objects.values_list('path', flat=True).get(pk=parent.pk)
+        if self.pk and str(self.pk) in parent_path.split('/'):
+            raise ValidationError("Category can't be moved below itself")
+
+        subtree_length = len(f'{self.pk}/') if self.pk else len(f'{parent.pk}/')
+        if self.pk and self.path:
+            longest = Category.objects\
+                .filter(path__startswith=self.path)\
+                .aggregate(longest=Max(Length('path')))['longest']
+            subtree_length = (longest or len(self.path)) - len(self.path) + len(f'{self.pk}/')
+        if len(parent_path) + subtree_length > self._meta.get_field('path').max_length:
+            raise ValidationError("Categories can't be nested this deep")
+
+    def clean(self):
+        self.check_parent(self.parent_category)
+
+    def save(self, *args, **kwargs):
+        # the API and the admin don't all call clean(), a cycle would
+        # corrupt the path of every category in it
+        if self._state.adding or self.parent_category_id != getattr(self, '_loaded_parent_category_id', None):
+            self.check_parent(self.parent_category)
+        return super().save(*args, **kwargs)
 
-        parse(self)
-        return categories[::-1]
+    def get_category_tree(self):
+        """Ancestors from the root down to this category, in one query."""
+        ids = self.get_ancestor_ids()
+        categories = Category.objects.in_bulk(ids)
+        return [categories[pk] for pk in ids if pk in categories]
 
     def get_child_categories(self):
+        """
+        This category followed by its whole subtree, depth first with
+        siblings by name, in one query.
+        """
+        root = self
+        children = {}
+        for category in Category.objects.filter(path__startswith=self.path):
+            if category.pk == self.pk:
+                root = category
+            else:
+                children.setdefault(category.parent_category_id, []).append(category)
         categories = []
-
-        def parse(category):
-            categories.append(category)
-            for child_category in category.child_categories.all():
-                if child_category not in categories:
-                    parse(child_category)
-
-        parse(self)
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            categories.append(current)
+            stack.extend(reversed(children.get(current.pk, [])))
         return categories
 
 
@@ -190,6 +381,46 @@ def category_pre_save_receiver(sender, instance, *args, **kwargs):
 pre_save.connect(category_pre_save_receiver, sender=Category)
 
 
+def category_post_save_receiver(sender, instance, *args, **kwargs):
+    old_path, new_path = instance.path, instance.build_path()
+    if old_path == new_path:
+        return
+    Category.objects.filter(pk=instance.pk).update(path=new_path)
+    if old_path:
+        # move the subtree along
+        Category.objects\
+            .filter(path__startswith=old_path)\
+            .exclude(pk=instance.pk)\
+            .update(path=Concat(Value(new_path), Substr('path', len(old_path) + 1)))
+    instance.path = new_path
+
+
+post_save.connect(category_post_save_receiver, sender=Category)
+
+
+def category_usage_post_save_receiver(sender, instance, created, *args, **kwargs):
+    loaded_parent_id = getattr(instance, '_loaded_parent_category_id', None)
+    if created or instance.parent_category_id != loaded_parent_id:
+        Category.objects.refresh_usage([loaded_parent_id, instance.parent_category_id])
+    instance._loaded_parent_category_id = instance.parent_category_id
+
+
+def category_usage_post_delete_receiver(sender, instance, *args, **kwargs):
+    Category.objects.refresh_usage([instance.parent_category_id])
+
+
+post_save.connect(category_usage_post_save_receiver, sender=Category)
+post_delete.connect(category_usage_post_delete_receiver, sender=Category)
+
+
+def category_tree_changed_receiver(sender, instance, *args, **kwargs):
+    transaction.on_commit(bump_category_tree_version)
+
+
+post_save.connect(category_tree_changed_receiver, sender=Category)
+post_delete.connect(category_tree_changed_receiver, sender=Category)
+
+
 class ModuleManager(models.Manager):
     def visible(self):
         return self.get_queryset().filter(visible=True)
@@ -212,44 +443,45 @@ class Module(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # the order of a new module is taken under a lock on its course
+        with transaction.atomic():
+            return super().save(*args, **kwargs)
+
     def move(self, n):
-        if isinstance(n, int):
-            qs = self.course.module_set
-            current_n = self.order
-            to_swap = qs.filter(order=n)
-
-            if to_swap.exists():
-                to_swap = to_swap.first()
-                to_swap.order = current_n
-                self.order = n
-
-                to_swap.save()
-                self.save()
-            else:
-                self.order = n
-                self.save()
-        else:
-            self.order = 1
-            self.save()
-        return self.order
+        return move_to(self, n)
 
     def move_up(self):
-        if self.order != 1:
-            return self.move(self.order-1)
+        return move_to_neighbour(self, -1)
 
     def move_down(self):
-        course = self.course
-        if self.order != course.module_set.latest('order').order:
-            return self.move(self.order+1)
+        return move_to_neighbour(self, 1)
+
+    def reorder_contents(self, user, ordered_ids):
+        if self.course is None:
+            raise PermissionDenied
+        self.course.apply_order(user, self.content_set.all(), ordered_ids)
+
+
+class ContentQuerySet(models.query.QuerySet):
+    def with_items(self):
+        """Load the items of all contents with one query per content type."""
+        return self.select_related('content_type').prefetch_related('item')
 
 
 class AvailableContentManager(models.Manager):
+    def get_queryset(self):
+        return ContentQuerySet(self.model, using=self._db)
+
     def get_available_queryset(self, user):
-        qs = super().get_queryset()
-        return qs.filter(Q(owner=user) | Q(course__in=user.courses.all()) | Q(course__in=user.course_set.all()))
+        qs = self.get_queryset()
+        return qs.filter(Q(owner=user) | Q(course_id__in=Course.objects.accessible_ids(user)))
 
 
 class ContentManager(AvailableContentManager):
+    def with_items(self):
+        return self.get_queryset().with_items()
+
     def get_texts(self, user):
         text_type = ContentType.objects.get_for_model(Text)
         return self.get_available_queryset(user).filter(content_type=text_type)
@@ -267,6 +499,14 @@ class ContentManager(AvailableContentManager):
         return self.get_available_queryset(user).filter(content_type=file_type)
 
 
+CONTENT_KINDS = (
+    ('text', 'Text'),
+    ('image', 'Image'),
+    ('file', 'File'),
+    ('video', 'Video'),
+)
+
+
 class Content(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     module = models.ForeignKey(Module, on_delete=models.CASCADE)
@@ -277,69 +517,85 @@ class Content(models.Model):
     item = GenericForeignKey('content_type', 'object_id')
     order = OrderField(for_fields=['module'], blank=True)
 
+    # summary of the item, maintained by ItemBase.save
+    title = models.CharField(max_length=255, blank=True, editable=False)
+    kind = models.CharField(max_length=10, choices=CONTENT_KINDS, blank=True, editable=False)
+    created = models.DateTimeField(null=True, editable=False)
+    updated = models.DateTimeField(null=True, editable=False)
+    size = models.PositiveBigIntegerField(null=True, editable=False)
+
     objects = ContentManager()
 
     class Meta:
         ordering = ['order']
 
-    @property
-    def title(self):
-        if self.item:
-            return self.item.title
-        else:
-            return None
-
-    @property
-    def created(self):
-        return self.item.created
+    def __str__(self):
+        return f"{self.order}. {self.title}"
 
-    @property
-    def updated(self):
-        return self.item.updated
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.item is not None:
+            self.set_summary(self.item)
+        # the order of a new content is taken under a lock on its module
+        with transaction.atomic():
+            return super().save(*args, **kwargs)
 
-    def __str__(self):
-        return f"{self.order}. {self.item.title}"
+    def set_summary(self, item):
+        for field, value in item.get_summary().items():
+            setattr(self, field, value)
 
     def delete(self):
         self.item.delete()
         return super().delete()
 
     def get_absolute_url(self):
-        return reverse(f"courses:{self.item.__class__.__name__.lower()}_detail", kwargs={"pk": self.pk})
+        return reverse(f"courses:{self.kind}_detail", kwargs={"pk": self.pk})
 
     def get_download_url(self):
-        return reverse("courses:file_download", kwargs={"pk1": self.pk, "pk2": self.item.pk})
+        return reverse("courses:file_download", kwargs={"pk1": self.pk, "pk2": self.object_id})
+
+    def get_thumbnail_url(self, size='medium'):
+        return reverse("courses:image_thumbnail", kwargs={"pk": self.pk, "size": size})
+
+    def get_thumbnail_urls(self):
+        if self.kind != 'image':
+            return {}
+        return {size: self.get_thumbnail_url(size) for size in THUMBNAIL_SIZES}
 
     def move(self, n):
-        if isinstance(n, int):
-            if n > 0:
-                qs = self.module.content_set
-                current_n = self.order
-                to_swap = qs.filter(order=n)
-
-                if to_swap.exists():
-                    to_swap = to_swap.first()
-                    to_swap.order = current_n
-                    self.order = n
-
-                    to_swap.save()
-                    self.save()
-                else:
-                    self.order = n
-                    self.save()
-            else:
-                self.order = 1
-                self.save()
-        return self.order
+        return move_to(self, n)
 
     def move_up(self):
-        if self.order != 1:
-            return self.move(self.order-1)
+        return move_to_neighbour(self, -1)
 
     def move_down(self):
-        module = self.module
-        if self.order != module.content_set.latest('order').order:
-            return self.move(self.order+1)
+        return move_to_neighbour(self, 1)
+
+
+CONTENT_COUNTERS = {
+    'text': 'text_count',
+    'image': 'image_count',
+    'file': 'file_count',
+    'video': 'video_count'
+}
+
+
+def update_content_counter(content, delta):
+    counter = CONTENT_COUNTERS.get(content.kind)
+    if counter is not None:
+        Course.objects.filter(pk=content.course_id).update(**{counter: F(counter) + delta})
+
+
+def content_post_save_receiver(sender, instance, created, *args, **kwargs):
+    if created:
+        update_content_counter(instance, 1)
+
+
+def content_post_delete_receiver(sender, instance, *args, **kwargs):
+    update_content_counter(instance, -1)
+
+
+post_save.connect(content_post_save_receiver, sender=Content)
+post_delete.connect(content_post_delete_receiver, sender=Content)
 
 
 class ItemBase(models.Model):
@@ -356,28 +612,76 @@ class ItemBase(models.Model):
     def get_absolute_url(self):
         return reverse(f"courses:{self.__class__.__name__.lower()}_detail", kwargs={"pk": self.pk})
 
+    def get_size(self):
+        return None
+
+    def get_summary(self):
+        """Values copied to the Content rows pointing at this item."""
+        return {
+            'title': self.title,
+            'kind': self._meta.model_name,
+            'created': self.created,
+            'updated': self.updated,
+            'size': self.get_size(),
+        }
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        # a new item gets its summary when its Content is created
+        if adding:
+            return
+        Content.objects.filter(
+            content_type=ContentType.objects.get_for_model(self),
+            object_id=self.pk
+        ).update(**self.get_summary())
+
 
 class Text(ItemBase):
     content = models.TextField()
 
 
 class File(ItemBase):
-    file = models.FileField(upload_to='files', storage=FileSystemStorage(location=settings.PROTECTED_ROOT))
+    file = models.FileField(upload_to='files', storage=ContentAddressedStorage())
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file_name = instance.__dict__.get('file')
+        return instance
 
     def get_download_url(self):
         return self.file.url
 
+    def get_size(self):
+        try:
+            return self.file.size
+        except (OSError, ValueError):
+            return None
+
     @property
     def name(self):
         return get_filename(self.file.name)
 
 
-class Image(ItemBase):
-    file = models.FileField(upload_to='images', storage=FileSystemStorage(location=settings.PROTECTED_ROOT))
+class Image(ThumbnailsMixin, ItemBase):
+    file = models.FileField(upload_to='images', storage=ContentAddressedStorage())
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file_name = instance.__dict__.get('file')
+        return instance
 
     def get_download_url(self):
         return self.file.url
 
+    def get_size(self):
+        try:
+            return self.file.size
+        except (OSError, ValueError):
+            return None
+
     @property
     def name(self):
         return get_filename(self.file.name)
@@ -387,6 +691,80 @@ class Video(ItemBase):
     file = models.URLField()
 
 
+def image_thumbnails_post_save_receiver(sender, instance, *args, **kwargs):
+    if instance.thumbnails_outdated():
+        image_id = instance.pk
+        transaction.on_commit(lambda: tasks.generate_image_thumbnails.delay(image_id))
+
+
+def image_thumbnails_post_delete_receiver(sender, instance, *args, **kwargs):
+    if instance.thumbnails_for:
+        delete_thumbnails(instance.file.storage, instance.thumbnails_for)
+
+
+post_save.connect(image_thumbnails_post_save_receiver, sender=Image)
+post_delete.connect(image_thumbnails_post_delete_receiver, sender=Image)
+
+
+class BlobManager(models.Manager):
+    def acquire(self, digest, size=0):
+        """Count one more reference to the blob, creating its row for a new one."""
+        if self.filter(digest=digest).update(references=F('references') + 1):
+            return
+        blob, created = self.get_or_create(digest=digest, defaults={'size': size, 'references': 1})
+        if not created:
+            self.filter(digest=digest).update(references=F('references') + 1)
+
+    def release(self, name, storage):
+        """Drop the reference held by a stored name, the blob goes after commit if it was the last."""
+        digest = get_digest(name) if name else None
+        if digest is None:
+            return
+        self.filter(digest=digest, references__gt=0).update(references=F('references') - 1)
+        transaction.on_commit(lambda: self.collect(digest, storage))
+
+    def collect(self, digest, storage):
+        with transaction.atomic():
+            blob = self.select_for_update().filter(digest=digest, references=0).first()
+            if blob is None:
+                return
+            storage.delete_blob(digest)
+            blob.delete()
+
+
+class Blob(models.Model):
+    """
+    A file kept by ContentAddressedStorage. references counts the saves that
+    linked to it, one per File or Image holding its name.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = BlobManager()
+
+    def __str__(self):
+        return f"{self.digest} ({self.references})"
+
+
+def item_file_post_save_receiver(sender, instance, *args, **kwargs):
+    loaded = getattr(instance, '_loaded_file_name', None)
+    if loaded and loaded != instance.file.name:
+        Blob.objects.release(loaded, instance.file.storage)
+    instance._loaded_file_name = instance.file.name
+
+
+def item_file_post_delete_receiver(sender, instance, *args, **kwargs):
+    Blob.objects.release(instance.file.name, instance.file.storage)
+
+
+post_save.connect(item_file_post_save_receiver, sender=File)
+post_delete.connect(item_file_post_delete_receiver, sender=File)
+post_save.connect(item_file_post_save_receiver, sender=Image)
+post_delete.connect(item_file_post_delete_receiver, sender=Image)
+
+
 join_methods = (
     ('key', 'Key'),
     ('owner', "Added by owner")
@@ -416,4 +794,135 @@ class CourseAdmin(models.Model):
         ordering = ['user__full_name']
 
     def __str__(self):
-        return f"{self.user} admin of {self.course}"
\ No newline at end of file
+        return f"{self.user} admin of {self.course}"
+
+def course_access_changed_receiver(sender, instance, *args, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_course_access([user_id]))
+
+
+post_save.connect(course_access_changed_receiver, sender=Membership)
+post_delete.connect(course_access_changed_receiver, sender=Membership)
+post_save.connect(course_access_changed_receiver, sender=CourseAdmin)
+post_delete.connect(course_access_changed_receiver, sender=CourseAdmin)
+
+
+def course_users_changed_receiver(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(), remember who is affected
+        if reverse:
+            instance._cleared_user_ids = {instance.pk}
+        else:
+            instance._cleared_user_ids = set(sender.objects.filter(course=instance).values_list('user_id', flat=True))
+        return
+    if action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_user_ids', set())
+    elif action in ('post_add', 'post_remove'):
+        user_ids = {instance.pk} if reverse else set(pk_set)
+    else:
+        return
+    transaction.on_commit(lambda: invalidate_course_access(user_ids))
+
+
+m2m_changed.connect(course_users_changed_receiver, sender=Membership)
+m2m_changed.connect(course_users_changed_receiver, sender=CourseAdmin)
+
+
+UPLOAD_KINDS = (
+    ('file', 'File'),
+    ('image', 'Image'),
+)
+
+
+class UploadSessionQuerySet(models.query.QuerySet):
+    def expired(self, age=timedelta(days=1)):
+        return self.filter(content=None, updated__lt=timezone.now() - age)
+
+
+class UploadSession(models.Model):
+    """
+    A file sent in chunks. The bytes go straight into a part file under
+    PROTECTED_ROOT, offset tells how many have arrived, and the last chunk
+    turns the upload into a File or Image content of the module.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    module = models.ForeignKey(Module, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=UPLOAD_KINDS)
+    title = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    visible = models.BooleanField(default=False)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    content = models.OneToOneField(Content, on_delete=models.SET_NULL, null=True, blank=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = UploadSessionQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def complete(self):
+        return self.content_id is not None
+
+    def write_chunk(self, start, stream, length):
+        """
+        Append a chunk starting at start, which must equal the current offset.
+        Returns False when another request moved the offset in the meantime.
+        The last chunk moves the offset and creates the content in one
+        transaction, so if that fails the chunk can simply be sent again.
+        """
+        if start != self.offset or start + length > self.size:
+            return False
+        written = write_chunk(self, start, stream, length)
+        try:
+            with transaction.atomic():
+                updated = UploadSession.objects\
+                    .filter(pk=self.pk, offset=start)\
+                    .update(offset=start + written, updated=timezone.now())
+                if not updated:
+                    return False
+                self.offset = start + written
+                if self.offset == self.size:
+                    self.finish()
+        except ValidationError:
+            # the file is not what it claims to be, there is nothing to resume
+            self.delete()
+            raise
+        except Exception:
+            self.offset = start
+            raise
+        return True
+
+    def finish(self):
+        """
+        Create the item and its Content from the assembled file. Must be
+        called inside a transaction; the part file is removed after commit.
+        """
+        if self.kind == 'image':
+            verify_image(get_part_path(self))
+        item_class = Image if self.kind == 'image' else File
+        item = item_class(title=self.title)
+        item.file.name = move_into_storage(self, item)
+        item.save()
+        content = Content(
+            module=self.module,
+            course_id=self.module.course_id,
+            owner=self.owner,
+            visible=self.visible,
+            item=item
+        )
+        content.save()
+        self.content = content
+        self.save(update_fields=['content', 'updated'])
+        transaction.on_commit(lambda: remove_part(self))
+        return content
+
+
+def upload_session_post_delete_receiver(sender, instance, *args, **kwargs):
+    remove_part(instance)
+
+
+post_delete.connect(upload_session_post_delete_receiver, sender=UploadSession)
@@ -1,6 +1,8 @@
 from rest_framework import serializers
-from .models import Course, Category, Module, Text, Content, Image, Video, File
+from .models import Course, Category, Module, Text, Content, Image, Video, File, UploadSession
 from accounts.serializers import SnippetUserSerializer
+from .tree import get_category_tree
+from .uploads import UPLOAD_MAX_SIZE
 
 
 class SnippetModuleSerializer(serializers.HyperlinkedModelSerializer):
@@ -66,17 +68,43 @@ class CreateCourseSerializer(serializers.ModelSerializer):
         fields = ['title', 'overview', 'category']
 
 
+class ParentCategoryField(serializers.HyperlinkedRelatedField):
+    """Parent category link, read from the shared category tree."""
+    def __init__(self, **kwargs):
+        kwargs.setdefault('view_name', 'category-detail')
+        kwargs.setdefault('lookup_field', 'slug')
+        kwargs.setdefault('queryset', Category.objects.all())
+        kwargs.setdefault('allow_null', True)
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if instance.parent_category_id is None:
+            return None
+        return get_category_tree().get(instance.parent_category_id)
+
+
 class CategorySerializer(serializers.HyperlinkedModelSerializer):
+    parent_category = ParentCategoryField()
+    course_count = serializers.SerializerMethodField()
+
     class Meta:
         model = Category
-        fields = ['url', 'id', 'name', 'slug', 'parent_category']
+        fields = ['url', 'id', 'name', 'slug', 'parent_category', 'course_count']
         extra_kwargs = {
             'url': {'lookup_field': 'slug'},
-            'parent_category': {'lookup_field': 'slug'}
         }
 
+    def get_course_count(self, obj):
+        return get_category_tree().get_course_count(obj, subtree=True)
+
+    def validate_parent_category(self, value):
+        (self.instance or Category()).check_parent(value)
+        return value
+
 
 class DetailCategorySerializer(serializers.HyperlinkedModelSerializer):
+    parent_category = ParentCategoryField()
     course_set = SnippetCourseSerializer(many=True, read_only=True)
 
     class Meta:
@@ -84,21 +112,28 @@ class DetailCategorySerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'name', 'slug', 'parent_category', 'course_set']
         extra_kwargs = {
             'url': {'lookup_field': 'slug'},
-            'parent_category': {'lookup_field': 'slug'}
         }
 
+    def validate_parent_category(self, value):
+        (self.instance or Category()).check_parent(value)
+        return value
+
 
 class EnrollCourseSerializer(serializers.Serializer):
     access_key = serializers.CharField()
 
 
+class ReorderSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
 class BaseContentSerializer(serializers.ModelSerializer):
     owner = SnippetUserSerializer(many=False, read_only=True)
     course = SnippetCourseSerializer(many=False, read_only=True)
 
     class Meta:
         model = Content
-        fields = ['id', 'title', 'owner', 'course', 'module',
+        fields = ['id', 'title', 'kind', 'size', 'owner', 'course', 'module',
                   'visible', 'order', 'item', 'created', 'updated']
 
     def create(self, validated_data):
@@ -140,6 +175,17 @@ class ImageSerializer(serializers.ModelSerializer):
 class ImageContentSerializer(BaseContentSerializer):
     item = ImageSerializer(many=False, read_only=True)
     item_class = Image
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta(BaseContentSerializer.Meta):
+        fields = BaseContentSerializer.Meta.fields + ['thumbnails']
+
+    def get_thumbnails(self, obj):
+        request = self.context.get('request')
+        urls = obj.get_thumbnail_urls()
+        if request is not None:
+            urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+        return urls
 
 
 class VideoSerializer(serializers.ModelSerializer):
@@ -162,3 +208,26 @@ class FileSerializer(serializers.ModelSerializer):
 class FileContentSerializer(BaseContentSerializer):
     item = FileSerializer(many=False, read_only=True)
     item_class = File
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    module = serializers.PrimaryKeyRelatedField(queryset=Module.objects.select_related('course'))
+    size = serializers.IntegerField(min_value=1, max_value=UPLOAD_MAX_SIZE)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'module', 'kind', 'title', 'filename', 'visible',
+                  'size', 'offset', 'complete', 'content', 'created', 'updated']
+        read_only_fields = ['offset', 'content']
+
+    def validate_filename(self, value):
+        # only the name, never a path
+        value = value.replace('\\', '/').rsplit('/', 1)[-1]
+        if value in ('', '.', '..'):
+            raise serializers.ValidationError("Invalid file name")
+        return value
+
+    def validate_module(self, module):
+        if not module.course.can_edit_content(self.context['request'].user):
+            raise serializers.ValidationError("You can't add content to this module")
+        return module
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def split_name(name):
+    """
+    (digest, rest) of a stored name. '<dir>/<digest>/<filename>' names a blob,
+    '<dir>/<digest>/<more>/<file>' a file derived from it, such as a
+    thumbnail. digest is None for files stored before hashing was added.
+    """
+    parts = name.replace('\\', '/').split('/')
+    for i, part in enumerate(parts[:-1]):
+        if DIGEST_RE.match(part):
+            return part, parts[i + 1:]
+    return None, parts
+
+
+def get_digest(name):
+    digest, rest = split_name(name)
+    return digest if digest is not None and len(rest) == 1 else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct file once under blobs/, named by its SHA-256. The
+    names given to models keep the upload directory and the original file
+    name around the digest, e.g. files/<digest>/syllabus.pdf, so identical
+    uploads share one blob. Files derived from a blob live in derived/<digest>/
+    and are shared too. Every save takes a reference on the blob's Blob row;
+    the blob and its derived files are removed when the last one is released.
+    """
+
+    @property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PROTECTED_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PROTECTED_ROOT':
+            self.__dict__.pop('location', None)
+
+    def blob_name(self, digest):
+        return os.path.join('blobs', digest[:2], digest)
+
+    def path(self, name):
+        digest, rest = split_name(name)
+        if digest is None:
+            return super().path(name)
+        if len(rest) == 1:
+            return super().path(self.blob_name(digest))
+        return super().path(os.path.join('derived', digest, *rest[:-1], rest[-1]))
+
+    def get_available_name(self, name, max_length=None):
+        # equal names refer to equal content, nothing to make unique
+        return name
+
+    def _hash_into(self, chunks, directory):
+        """Write the chunks to a temporary file in directory while hashing them."""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), tmp_path
+
+    def _store(self, tmp_path, digest):
+        """
+        Take a reference on the blob, then move the hashed temporary file into
+        place or drop it when the blob exists. Referencing first keeps
+        Blob.objects.collect() from removing a blob that is being linked to.
+        """
+        Blob = apps.get_model('courses', 'Blob')
+        Blob.objects.acquire(digest, os.path.getsize(tmp_path))
+        blob_path = super().path(self.blob_name(digest))
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, blob_path)
+
+    def _save(self, name, content):
+        digest, rest = split_name(name)
+        if digest is not None and len(rest) > 1:
+            # derived files are written in place, replacing older versions
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _, tmp_path = self._hash_into(content.chunks(), os.path.dirname(path))
+            os.replace(tmp_path, path)
+            return name.replace('\\', '/')
+
+        directory = super().path('tmp')
+        os.makedirs(directory, exist_ok=True)
+        digest, tmp_path = self._hash_into(content.chunks(), directory)
+        self._store(tmp_path, digest)
+        head, filename = os.path.split(name)
+        return '/'.join(part for part in (head.replace('\\', '/'), digest, filename) if part)
+
+    def save_path(self, name, path):
+        """
+        Store the file at path, which must be on the same file system, under
+        name. It is read once to hash it and then moved, not copied.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        digest = digest.hexdigest()
+        self._store(path, digest)
+        head, filename = os.path.split(name)
+        return '/'.join(part for part in (head.replace('\\', '/'), digest, filename) if part)
+
+    def delete(self, name):
+        digest, rest = split_name(name)
+        if digest is not None:
+            Blob = apps.get_model('courses', 'Blob')
+            if Blob.objects.filter(digest=digest, references__gt=0).exists():
+                # still used by another File or Image
+                return
+        super().delete(name)
+
+    def delete_blob(self, digest):
+        super().delete(self.blob_name(digest))
+        shutil.rmtree(super().path(os.path.join('derived', digest)), ignore_errors=True)
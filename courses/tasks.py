@@ -9,3 +9,11 @@ def send_added_to_course_confirmation_email(menbership_id):
     from courses.models import Membership
     membership = Membership.objects.get(id=menbership_id)
     send_member_email(menbership_id)
+
+
+@shared_task
+def generate_image_thumbnails(image_id):
+    from courses.models import Image
+    image = Image.objects.filter(id=image_id).first()
+    if image is not None and image.thumbnails_outdated():
+        image.update_thumbnails()
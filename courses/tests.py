@@ -1,3 +1,640 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from .downloads import RangeNotSatisfiable, if_range_matches, parse_range_header
+from .fields import assign_order, move_to, move_to_neighbour, reorder
+
+from .models import Blob, Content, Course, CourseAdmin, File, Image, Module, Text, UploadSession, Video
+from .storage import ContentAddressedStorage, get_digest, split_name
+from .thumbnails import THUMBNAIL_SIZES
+from .uploads import get_part_path, parse_content_range
+
+DIGEST = 'ab' * 32
+
+
+class ProtectedRootMixin:
+    """Runs each test with PROTECTED_ROOT in a temporary directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.protected_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.protected_root, ignore_errors=True)
+        settings_override = override_settings(PROTECTED_ROOT=self.protected_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class StorageNameTests(SimpleTestCase):
+    def test_blob_name(self):
+        self.assertEqual(split_name(f'files/{DIGEST}/a.pdf'), (DIGEST, ['a.pdf']))
+        self.assertEqual(get_digest(f'files/{DIGEST}/a.pdf'), DIGEST)
+
+    def test_derived_name(self):
+        name = f'images/{DIGEST}/thumbs/a_small.jpeg'
+        self.assertEqual(split_name(name), (DIGEST, ['thumbs', 'a_small.jpeg']))
+        self.assertIsNone(get_digest(name))
+
+    def test_name_stored_before_hashing(self):
+        self.assertEqual(split_name('files/a.pdf'), (None, ['files', 'a.pdf']))
+        self.assertIsNone(get_digest('files/a.pdf'))
+        self.assertIsNone(get_digest(f'files/{DIGEST}'))
+
+
+class ContentAddressedStorageTests(ProtectedRootMixin, TransactionTestCase):
+    # transactional, so blobs are collected on commit like in production
+
+    def create_file(self, data, name):
+        return File.objects.create(title=name, file=ContentFile(data, name))
+
+    def blob_count(self):
+        return sum(len(files) for _, _, files in os.walk(os.path.join(self.protected_root, 'blobs')))
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.create_file(b'syllabus', 'syllabus.pdf')
+        second = self.create_file(b'syllabus', 'copy.pdf')
+
+        self.assertNotEqual(first.file.name, second.file.name)
+        self.assertEqual(first.name, 'syllabus.pdf')
+        self.assertEqual(first.file.path, second.file.path)
+        self.assertEqual(Blob.objects.get(pk=get_digest(first.file.name)).references, 2)
+        self.assertEqual(self.blob_count(), 1)
+        with second.file.open('rb') as f:
+            self.assertEqual(f.read(), b'syllabus')
+
+    def test_blob_is_removed_with_its_last_reference(self):
+        first = self.create_file(b'syllabus', 'syllabus.pdf')
+        second = self.create_file(b'syllabus', 'copy.pdf')
+        digest, path = get_digest(first.file.name), first.file.path
+
+        first.delete()
+        self.assertEqual(Blob.objects.get(pk=digest).references, 1)
+        self.assertTrue(os.path.exists(path))
+
+        second.delete()
+        self.assertFalse(Blob.objects.filter(pk=digest).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_replacing_the_file_releases_the_old_blob(self):
+        item = self.create_file(b'first version', 'notes.txt')
+        old_digest, old_path = get_digest(item.file.name), item.file.path
+
+        item = File.objects.get(pk=item.pk)
+        item.file = ContentFile(b'second version', 'notes.txt')
+        item.save()
+
+        self.assertFalse(Blob.objects.filter(pk=old_digest).exists())
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(Blob.objects.get(pk=get_digest(item.file.name)).references, 1)
+
+    def test_collect_keeps_referenced_blobs(self):
+        item = self.create_file(b'syllabus', 'syllabus.pdf')
+        digest = get_digest(item.file.name)
+
+        Blob.objects.collect(digest, item.file.storage)
+        self.assertTrue(Blob.objects.filter(pk=digest).exists())
+        self.assertTrue(os.path.exists(item.file.path))
+
+    def test_release_of_a_name_without_digest_is_ignored(self):
+        Blob.objects.release('files/legacy.pdf', ContentAddressedStorage())
+        self.assertFalse(Blob.objects.exists())
+
+    def test_save_path_moves_and_deduplicates(self):
+        storage = ContentAddressedStorage()
+        paths = []
+        for i in range(2):
+            path = os.path.join(self.protected_root, f'{i}.part')
+            with open(path, 'wb') as f:
+                f.write(b'uploaded in chunks')
+            paths.append(path)
+
+        first = storage.save_path('files/video.mp4', paths[0])
+        second = storage.save_path('files/video.mp4', paths[1])
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('/video.mp4'))
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertEqual(Blob.objects.get(pk=get_digest(first)).references, 2)
+        with storage.open(first) as f:
+            self.assertEqual(f.read(), b'uploaded in chunks')
+
+
+class SharedThumbnailsTests(ProtectedRootMixin, TestCase):
+    # on_commit callbacks never run here, thumbnails are made and blobs
+    # collected by calling what the task and the callback would call
+
+    def create_image(self, data, name):
+        image = Image.objects.create(title=name, file=ContentFile(data, name))
+        image.update_thumbnails()
+        return image
+
+    def thumbnails_exist(self, image):
+        # JPEG is always available, WebP depends on how Pillow was built
+        storage = image.file.storage
+        return all(storage.exists(image.get_thumbnail_name(size)) for size in THUMBNAIL_SIZES)
+
+    def png(self, color):
+        buffer = BytesIO()
+        PILImage.new('RGB', (800, 600), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_deleting_one_of_two_identical_images_keeps_thumbnails(self):
+        first = self.create_image(self.png((200, 30, 30)), 'photo.png')
+        second = self.create_image(self.png((200, 30, 30)), 'photo.png')
+        digest, storage = get_digest(first.file.name), first.file.storage
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(self.thumbnails_exist(second))
+
+        first.delete()
+        Blob.objects.collect(digest, storage)
+        self.assertTrue(self.thumbnails_exist(second))
+        self.assertTrue(os.path.exists(second.file.path))
+
+        second.delete()
+        Blob.objects.collect(digest, storage)
+        self.assertFalse(Blob.objects.filter(pk=digest).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.protected_root, 'derived', digest)))
+
+    def test_replacing_one_of_two_identical_images_keeps_thumbnails(self):
+        first = self.create_image(self.png((200, 30, 30)), 'photo.png')
+        second = self.create_image(self.png((200, 30, 30)), 'photo.png')
+
+        first = Image.objects.get(pk=first.pk)
+        first.file = ContentFile(self.png((30, 30, 200)), 'photo.png')
+        first.save()
+        first.update_thumbnails()
+
+        self.assertNotEqual(first.file.name, second.file.name)
+        self.assertTrue(self.thumbnails_exist(first))
+        self.assertTrue(self.thumbnails_exist(second))
+
+
+def create_content(module, item):
+    return Content.objects.create(
+        course=module.course, module=module, owner=module.owner, visible=True, item=item
+    )
+
+
+class CourseTestData:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('teacher@example.com', password='secret', is_teacher=True)
+        cls.course = Course.objects.create(title='Physics', slug='physics', owner=cls.user, overview='Physics')
+        cls.module = Module.objects.create(course=cls.course, title='Optics', owner=cls.user, visible=True)
+
+
+class ContentCounterTests(CourseTestData, TestCase):
+    def counts(self):
+        return Course.objects.values('text_count', 'image_count', 'file_count', 'video_count').get(pk=self.course.pk)
+
+    def test_counters_follow_contents(self):
+        text = create_content(self.module, Text.objects.create(title='Lenses', content='...'))
+        create_content(self.module, Text.objects.create(title='Mirrors', content='...'))
+        create_content(self.module, Video.objects.create(title='Prism', file='https://example.com/prism'))
+        create_content(self.module, File.objects.create(title='Notes', file='files/notes.pdf'))
+        image = create_content(self.module, Image.objects.create(title='Spectrum', file='images/spectrum.png'))
+        self.assertEqual(self.counts(), {'text_count': 2, 'image_count': 1, 'file_count': 1, 'video_count': 1})
+
+        text.delete()
+        image.delete()
+        self.assertEqual(self.counts(), {'text_count': 1, 'image_count': 0, 'file_count': 1, 'video_count': 1})
+
+    def test_saving_a_stale_course_keeps_counters(self):
+        course = Course.objects.get(pk=self.course.pk)
+        create_content(self.module, Text.objects.create(title='Lenses', content='...'))
+        course.title = 'Physics I'
+        course.save()
+        self.assertEqual(self.counts()['text_count'], 1)
+
+    def test_deleting_a_module_updates_counters(self):
+        create_content(self.module, Text.objects.create(title='Lenses', content='...'))
+        Module.objects.get(pk=self.module.pk).delete()
+        self.assertEqual(self.counts()['text_count'], 0)
+
+
+def annotate_content_counts(queryset):
+    """The per-kind counts as Course.objects.all() computed them before the counter columns."""
+    types = ContentType.objects.get_for_models(Text, Image, File, Video)
+    return queryset.annotate(**{
+        f'{model._meta.model_name}s': Count(
+            'module__content', filter=Q(module__content__content_type=content_type)
+        )
+        for model, content_type in types.items()
+    })
+
+
+@tag('benchmark')
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "set RUN_BENCHMARKS=1 to run benchmarks")
+class CourseListingBenchmark(TestCase):
+    """Listing courses with counter columns against the old Count annotation."""
+    courses = 5000
+    contents_per_course = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('teacher@example.com', password='secret', is_teacher=True)
+        Course.objects.bulk_create(
+            Course(title=f'Course {i}', slug=f'course-{i}', owner=user, overview='') for i in range(cls.courses)
+        )
+        courses = list(Course.objects.order_by('pk'))
+        Module.objects.bulk_create(Module(course=course, title='Module', owner=user, order=1) for course in courses)
+        modules = Module.objects.order_by('course_id')
+        for module in modules.filter(course__pk__lte=courses[0].pk + 49):
+            for i in range(cls.contents_per_course):
+                create_content(module, Text.objects.create(title=f'Text {i}', content=''))
+
+    def time(self, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            rows = list(queryset)
+            elapsed = time.perf_counter() - start
+        return rows, elapsed, len(queries)
+
+    def test_listing(self):
+        counters = Course.objects.order_by('pk').values_list('pk', 'text_count', 'image_count', 'file_count', 'video_count')
+        annotated = annotate_content_counts(Course.objects.order_by('pk')).values_list(
+            'pk', 'texts', 'images', 'files', 'videos'
+        )
+        ContentType.objects.clear_cache()
+
+        old_rows, old_time, old_queries = self.time(annotated)
+        new_rows, new_time, new_queries = self.time(counters)
+
+        self.assertEqual(len(new_rows), self.courses)
+        self.assertEqual(new_rows, old_rows)
+        self.assertEqual(new_queries, 1)
+        self.assertLess(
+            new_time, old_time,
+            f"{self.courses} courses: counters {new_time * 1000:.1f} ms, "
+            f"annotation {old_time * 1000:.1f} ms in {old_queries} queries"
+        )
+
+
+class OrderingTests(CourseTestData, TestCase):
+    def setUp(self):
+        self.contents = [
+            create_content(self.module, Text.objects.create(title=f'Text {i}', content='')) for i in range(5)
+        ]
+        self.ids = [content.pk for content in self.contents]
+
+    def order(self):
+        return list(self.module.content_set.values_list('pk', flat=True))
+
+    def test_new_objects_are_appended(self):
+        self.assertEqual(self.order(), self.ids)
+        self.assertEqual([content.order for content in self.contents], [1, 2, 3, 4, 5])
+
+    def test_assign_order(self):
+        other = Module.objects.create(course=self.course, title='Mechanics', owner=self.user)
+        text = Text.objects.create(title='Text', content='')
+        objs = [
+            Content(course=self.course, module=module, owner=self.user, item=text)
+            for module in (self.module, other) * 10
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            assign_order(objs)
+        # one MAX() per module, not per object
+        self.assertEqual(len([q for q in queries if 'MAX(' in q['sql']]), 2)
+
+        Content.objects.bulk_create(objs)
+        self.assertEqual(
+            list(self.module.content_set.values_list('order', flat=True)), list(range(1, 16))
+        )
+        self.assertEqual(list(other.content_set.values_list('order', flat=True)), list(range(1, 11)))
+
+    def test_move_to(self):
+        self.assertEqual(move_to(self.contents[4], 2), 2)
+        self.assertEqual(self.order(), [self.ids[i] for i in (0, 4, 1, 2, 3)])
+
+        self.assertEqual(move_to(self.contents[0], 5), 5)
+        self.assertEqual(self.order(), [self.ids[i] for i in (4, 1, 2, 3, 0)])
+
+    def test_move_to_is_clamped(self):
+        self.assertEqual(move_to(self.contents[2], 0), 1)
+        self.assertEqual(move_to(self.contents[2], 100), 5)
+        self.assertEqual(self.order(), [self.ids[i] for i in (0, 1, 3, 4, 2)])
+
+    def test_move_to_neighbour(self):
+        move_to_neighbour(self.contents[1], -1)
+        self.assertEqual(self.order(), [self.ids[i] for i in (1, 0, 2, 3, 4)])
+
+        self.assertEqual(move_to_neighbour(self.contents[1], -1), 1)
+        self.assertEqual(move_to_neighbour(self.contents[4], 1), 5)
+        self.assertEqual(self.order(), [self.ids[i] for i in (1, 0, 2, 3, 4)])
+
+    def test_move_to_neighbour_of_a_stale_instance(self):
+        stale = Content.objects.get(pk=self.ids[2])
+        move_to(self.contents[2], 5)
+        stale.move_down()
+        self.assertEqual(self.order(), [self.ids[i] for i in (0, 1, 3, 4, 2)])
+        stale.move_up()
+        self.assertEqual(self.order(), [self.ids[i] for i in (0, 1, 3, 2, 4)])
+
+    def test_reorder(self):
+        new_order = [self.ids[i] for i in (3, 1, 4, 0, 2)]
+        with CaptureQueriesContext(connection) as queries:
+            reorder(self.module.content_set.all(), new_order)
+        self.assertEqual(self.order(), new_order)
+        # one SELECT and one bulk UPDATE, besides the savepoint
+        self.assertEqual(len([q for q in queries if 'courses_content' in q['sql']]), 2)
+
+    def test_reorder_needs_every_object_once(self):
+        contents = self.module.content_set.all()
+        for ids in (self.ids[:-1], self.ids + [self.ids[0]], self.ids[:-1] + [0]):
+            with self.subTest(ids=ids), self.assertRaises(ValueError):
+                reorder(contents, ids)
+        self.assertEqual(self.order(), self.ids)
+
+    def test_reorder_view(self):
+        self.client.force_login(self.user)
+        url = reverse('courses:reorder')
+        new_order = list(reversed(self.ids))
+
+        response = self.client.post(url, {'module': self.module.pk, 'ids': new_order}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), new_order)
+
+        response = self.client.post(url, {'module': self.module.pk, 'ids': self.ids[:2]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.order(), new_order)
+
+    def test_reorder_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('api:module-reorder', kwargs={'pk': self.module.pk})
+        new_order = list(reversed(self.ids))
+
+        response = client.post(url, {'ids': new_order}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), new_order)
+
+        response = client.post(url, {'ids': self.ids[:2]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.order(), new_order)
+
+    def test_reorder_permissions_match(self):
+        # both endpoints leave the decision to Course.apply_order
+        users = get_user_model().objects
+        editor = users.create_user('editor@example.com', password='secret', is_teacher=True)
+        CourseAdmin.objects.create(user=editor, course=self.course, can_edit_content=True)
+        staff = users.create_user('staff@example.com', password='secret', is_teacher=True)
+        staff.staff = True
+        staff.save()
+        client = APIClient()
+        new_order = list(reversed(self.ids))
+
+        for user, status_code in ((editor, 200), (staff, 403)):
+            with self.subTest(user=user.email):
+                self.client.force_login(user)
+                response = self.client.post(
+                    reverse('courses:reorder'), {'module': self.module.pk, 'ids': new_order},
+                    content_type='application/json'
+                )
+                self.assertEqual(response.status_code, status_code)
+
+                client.force_authenticate(user)
+                response = client.post(
+                    reverse('api:module-reorder', kwargs={'pk': self.module.pk}), {'ids': new_order}, format='json'
+                )
+                self.assertEqual(response.status_code, status_code)
+
+    def test_reorder_view_rejects_malformed_requests(self):
+        self.client.force_login(self.user)
+        url = reverse('courses:reorder')
+        for body in ('not json', '[]', json.dumps({'module': 'x', 'ids': self.ids}), json.dumps({'module': self.module.pk})):
+            with self.subTest(body=body):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+
+class RangeHeaderTests(SimpleTestCase):
+    def test_whole_file(self):
+        for header in (None, '', 'bytes=-', 'items=0-10', 'bytes=0-1,5-6', 'bytes=10-5'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, 100))
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-0': (0, 0),
+            'bytes=10-19': (10, 19),
+            'bytes = 10-19': (10, 19),
+            'bytes=90-': (90, 99),
+            'bytes=90-1000': (90, 99),
+            'bytes=-10': (90, 99),
+            'bytes=-1000': (0, 99),
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range_header(header, 100), expected)
+
+    def test_not_satisfiable(self):
+        for header, size in (('bytes=100-', 100), ('bytes=100-200', 100), ('bytes=-0', 100), ('bytes=-10', 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(RangeNotSatisfiable):
+                parse_range_header(header, size)
+
+    def test_if_range(self):
+        factory = RequestFactory()
+        etag, last_modified = '"1-2-3"', 1600000000
+        cases = (
+            ({}, True),
+            ({'HTTP_IF_RANGE': etag}, True),
+            ({'HTTP_IF_RANGE': '"1-2-4"'}, False),
+            ({'HTTP_IF_RANGE': 'W/' + etag}, False),
+            ({'HTTP_IF_RANGE': http_date(last_modified)}, True),
+            ({'HTTP_IF_RANGE': http_date(last_modified - 1)}, False),
+            ({'HTTP_IF_RANGE': 'not a date'}, False),
+        )
+        for headers, expected in cases:
+            with self.subTest(headers=headers):
+                self.assertIs(if_range_matches(factory.get('/', **headers), etag, last_modified), expected)
+
+
+@override_settings(PROTECTED_FILE_BACKEND='django')
+class FileDownloadTests(ProtectedRootMixin, CourseTestData, TestCase):
+    size = 5 * 1024 * 1024
+
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(self.size)
+        item = File.objects.create(title='Recording', file=ContentFile(self.data, 'recording.bin'))
+        content = create_content(self.module, item)
+        self.url = reverse('courses:file_download', kwargs={'pk1': content.pk, 'pk2': item.pk})
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(int(response['Content-Length']), self.size)
+        self.assertIn('filename="recording.bin"', response['Content-Disposition'])
+        self.assertEqual(self.body(response), self.data)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=1048576-2097151')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1048576-2097151/{self.size}')
+        self.assertEqual(int(response['Content-Length']), 1048576)
+        self.assertEqual(self.body(response), self.data[1048576:2097152])
+
+    def test_suffix_range(self):
+        response = self.get(HTTP_RANGE='bytes=-100')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[-100:])
+
+    def test_range_not_satisfiable(self):
+        response = self.get(HTTP_RANGE=f'bytes={self.size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{self.size}')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.get(HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"0-0-0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_conditional_get(self):
+        response = self.get()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"0-0-0"').status_code, 200)
+
+
+class ContentRangeTests(SimpleTestCase):
+    def test_valid(self):
+        self.assertEqual(parse_content_range('bytes 0-99/1000'), (0, 99, 1000))
+        self.assertEqual(parse_content_range(' bytes 999-999/1000 '), (999, 999, 1000))
+
+    def test_invalid(self):
+        headers = (
+            None, '', 'bytes */1000', 'bytes 0-99/*', 'bytes=0-99/1000', 'items 0-99/1000',
+            'bytes 100-99/1000', 'bytes 0-1000/1000',
+        )
+        for header in headers:
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                parse_content_range(header)
+
+
+class ChunkedUploadTests(ProtectedRootMixin, CourseTestData, TransactionTestCase):
+    # transactional, the part file is removed when the content is committed
+
+    def setUp(self):
+        super().setUp()
+        self.setUpTestData()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = os.urandom(300 * 1024)
+
+    def start(self, **kwargs):
+        data = {
+            'module': self.module.pk, 'kind': 'file', 'title': 'Lecture',
+            'filename': 'lecture.pdf', 'size': len(self.data), **kwargs
+        }
+        response = self.client.post(reverse('api:upload-list'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put(self, session_id, first, last, total=None):
+        return self.client.generic(
+            'PUT', reverse('api:upload-detail', kwargs={'pk': session_id}), self.data[first:last + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{total or len(self.data)}'
+        )
+
+    def test_upload_in_chunks(self):
+        session_id = self.start()
+        response = self.put(session_id, 0, 99999)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['offset'], 100000)
+
+        response = self.client.get(reverse('api:upload-detail', kwargs={'pk': session_id}))
+        self.assertEqual(response.data['offset'], 100000)
+
+        response = self.put(session_id, 100000, len(self.data) - 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['complete'])
+
+        session = UploadSession.objects.select_related('content').get(pk=session_id)
+        item = session.content.item
+        self.assertEqual((session.content.kind, session.content.size), ('file', len(self.data)))
+        self.assertEqual(item.name, 'lecture.pdf')
+        with item.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(get_part_path(session)))
+
+    def test_failed_last_chunk_can_be_sent_again(self):
+        session_id = self.start()
+        self.put(session_id, 0, 99999)
+        with mock.patch('courses.models.move_into_storage', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.put(session_id, 100000, len(self.data) - 1)
+
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual((session.offset, session.content), (100000, None))
+        self.assertFalse(Content.objects.exists())
+
+        response = self.put(session_id, 100000, len(self.data) - 1)
+        self.assertEqual(response.status_code, 201)
+        with UploadSession.objects.get(pk=session_id).content.item.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_body_shorter_than_the_range(self):
+        session_id = self.start()
+        url = reverse('api:upload-detail', kwargs={'pk': session_id})
+        for body in (b'', self.data[:10]):
+            with self.subTest(length=len(body)):
+                response = self.client.generic(
+                    'PUT', url, body, content_type='application/octet-stream',
+                    HTTP_CONTENT_RANGE=f'bytes 0-99999/{len(self.data)}'
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).offset, 0)
+
+    def test_chunk_out_of_order_is_a_conflict(self):
+        session_id = self.start()
+        self.put(session_id, 0, 99999)
+        response = self.put(session_id, 200000, 299999)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 100000)
+
+    def test_bad_content_range(self):
+        session_id = self.start()
+        self.assertEqual(self.put(session_id, 0, 99, total=100).status_code, 400)
+        response = self.client.generic(
+            'PUT', reverse('api:upload-detail', kwargs={'pk': session_id}), b'x', content_type='application/octet-stream'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_image_is_rejected(self):
+        session_id = self.start(kind='image', filename='photo.png')
+        response = self.put(session_id, 0, len(self.data) - 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.filter(pk=session_id).exists())
+        self.assertFalse(Image.objects.exists())
@@ -0,0 +1,127 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import models
+from PIL import Image as PILImage, ImageOps
+
+from .storage import get_digest
+
+# longest side in pixels, images are never upscaled
+THUMBNAIL_SIZES = {
+    'small': 128,
+    'medium': 512,
+    'large': 1280,
+}
+
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def get_thumbnail_name(name, size, fmt):
+    """images/photo.png -> images/thumbs/photo_medium.webp"""
+    directory, filename = os.path.split(name)
+    root = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbs', f'{root}_{size}.{fmt}')
+
+
+def get_thumbnail_names(name):
+    return [get_thumbnail_name(name, size, fmt) for size in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS]
+
+
+def get_available_formats():
+    PILImage.init()
+    return [fmt for fmt, (pil_format, _) in THUMBNAIL_FORMATS.items() if pil_format in PILImage.SAVE]
+
+
+def generate_thumbnails(storage, name):
+    """
+    Write every size in every format Pillow can encode next to the original,
+    replacing older files of the same name. Returns the written names.
+    """
+    with storage.open(name, 'rb') as f:
+        original = PILImage.open(f)
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    if original.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha, flatten onto white
+        original = original.convert('RGBA')
+        background = PILImage.new('RGB', original.size, (255, 255, 255))
+        background.paste(original, mask=original.getchannel('A'))
+        original = background
+    elif original.mode != 'RGB':
+        original = original.convert('RGB')
+
+    names = []
+    formats = get_available_formats()
+    for size, pixels in THUMBNAIL_SIZES.items():
+        thumbnail = original.copy()
+        thumbnail.thumbnail((pixels, pixels), PILImage.LANCZOS)
+        for fmt in formats:
+            pil_format, options = THUMBNAIL_FORMATS[fmt]
+            buffer = BytesIO()
+            thumbnail.save(buffer, pil_format, **options)
+            thumbnail_name = get_thumbnail_name(name, size, fmt)
+            storage.delete(thumbnail_name)
+            names.append(storage.save(thumbnail_name, ContentFile(buffer.getvalue())))
+    return names
+
+
+def delete_thumbnails(storage, name):
+    if get_digest(name) is not None:
+        # shared by every image of the blob, Blob.objects.collect() removes them
+        return
+    for thumbnail_name in get_thumbnail_names(name):
+        storage.delete(thumbnail_name)
+
+
+class ThumbnailsMixin(models.Model):
+    """
+    Thumbnails of the image in thumbnail_field, made by a Celery task after
+    upload. thumbnails_for holds the name of the image they were made from,
+    so a new upload falls back to the original until its thumbnails exist.
+    thumbnail_formats lists the formats the worker wrote, its Pillow may
+    encode others than the web process's.
+    """
+    thumbnail_field = 'file'
+
+    thumbnails_for = models.CharField(max_length=255, blank=True, editable=False)
+    thumbnail_formats = models.CharField(max_length=50, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def get_thumbnail_source(self):
+        return getattr(self, self.thumbnail_field)
+
+    def has_thumbnails(self):
+        source = self.get_thumbnail_source()
+        return bool(source) and self.thumbnails_for == source.name
+
+    def get_thumbnail_name(self, size, fmt='jpeg'):
+        return get_thumbnail_name(self.get_thumbnail_source().name, size, fmt)
+
+    def get_thumbnail_formats(self):
+        if not self.has_thumbnails() or not self.thumbnail_formats:
+            return []
+        return self.thumbnail_formats.split(',')
+
+    def thumbnails_outdated(self):
+        source = self.get_thumbnail_source()
+        return self.thumbnails_for != (source.name if source else '')
+
+    def update_thumbnails(self):
+        """Replace the thumbnails of the previous image with those of the current one."""
+        source = self.get_thumbnail_source()
+        if self.thumbnails_for:
+            delete_thumbnails(source.storage, self.thumbnails_for)
+        names = generate_thumbnails(source.storage, source.name) if source else []
+        written = {os.path.splitext(name)[1][1:] for name in names}
+        self.thumbnails_for = source.name if source else ''
+        self.thumbnail_formats = ','.join(fmt for fmt in THUMBNAIL_FORMATS if fmt in written)
+        # a plain UPDATE, saving would run the post_save receivers again
+        type(self)._default_manager.filter(pk=self.pk).update(
+            thumbnails_for=self.thumbnails_for, thumbnail_formats=self.thumbnail_formats
+        )
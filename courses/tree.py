@@ -0,0 +1,88 @@
+import threading
+
+from .models import Category
+from .utils import get_category_tree_version
+
+
+class CategoryTree:
+    """
+    Read-only snapshot of all categories with course counts, built with one
+    query. The Category instances are shared between requests and must not
+    be modified.
+    """
+    def __init__(self, version, categories, course_counts):
+        self.version = version
+        self.categories = sorted(categories, key=lambda category: category.name)
+        self.by_pk = {category.pk: category for category in self.categories}
+        self.by_slug = {category.slug: category for category in self.categories}
+
+        self.children = {}
+        for category in self.categories:
+            self.children.setdefault(category.parent_category_id, []).append(category)
+
+        self.course_counts = course_counts
+        self.total_counts = {}
+        for category in sorted(self.categories, key=lambda category: -category.path.count('/')):
+            total = course_counts.get(category.pk, 0)
+            total += sum(self.total_counts[child.pk] for child in self.get_children(category))
+            self.total_counts[category.pk] = total
+
+    @classmethod
+    def build(cls, version):
+        categories = list(Category.objects.all())
+        return cls(version, categories, {category.pk: category.course_count for category in categories})
+
+    def get(self, pk):
+        return self.by_pk.get(pk)
+
+    def get_by_slug(self, slug):
+        return self.by_slug.get(slug)
+
+    def get_roots(self):
+        return self.children.get(None, [])
+
+    def get_children(self, category):
+        return self.children.get(category.pk, [])
+
+    def get_parent(self, category):
+        return self.by_pk.get(category.parent_category_id)
+
+    def get_ancestors(self, category):
+        """Categories from the root down to the given one."""
+        return [self.by_pk[pk] for pk in category.get_ancestor_ids() if pk in self.by_pk]
+
+    def get_descendants(self, category):
+        """The given category followed by its whole subtree."""
+        categories = []
+        stack = [self.by_pk.get(category.pk, category)]
+        while stack:
+            current = stack.pop()
+            categories.append(current)
+            stack.extend(reversed(self.get_children(current)))
+        return categories
+
+    def get_course_count(self, category, subtree=False):
+        counts = self.total_counts if subtree else self.course_counts
+        return counts.get(category.pk, 0)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_category_tree():
+    """
+    The category tree shared by all requests of this process. It is rebuilt
+    when the version in the cache changes, so each worker pays for the
+    queries once per change, and at least every CATEGORY_TREE_VERSION_TIMEOUT
+    seconds when the cache is not shared between workers.
+    """
+    global _snapshot
+    version = get_category_tree_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = CategoryTree.build(version)
+    return snapshot
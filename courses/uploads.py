@@ -0,0 +1,99 @@
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from PIL import Image as PILImage
+
+UPLOAD_DIR = 'uploads'
+UPLOAD_BLOCK_SIZE = 64 * 1024
+# largest file accepted by a chunked upload, 2 GB by default
+UPLOAD_MAX_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def parse_content_range(header):
+    """(first, last, total) of a 'bytes first-last/total' Content-Range header."""
+    match = CONTENT_RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        raise ValueError("A Content-Range header 'bytes first-last/total' is required")
+    first, last, total = map(int, match.groups())
+    if last < first or last >= total:
+        raise ValueError("Invalid Content-Range")
+    return first, last, total
+
+
+def get_part_path(session):
+    return os.path.join(settings.PROTECTED_ROOT, UPLOAD_DIR, '%s.part' % session.pk)
+
+
+def write_chunk(session, start, stream, length):
+    """
+    Copy length bytes from stream into the part file at start, one block at a
+    time. Returns the number of bytes written, which is less than length when
+    the client went away; the upload resumes from there.
+    """
+    path = get_part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(start)
+        while written < length:
+            data = stream.read(min(UPLOAD_BLOCK_SIZE, length - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+    return written
+
+
+def verify_image(path):
+    try:
+        with PILImage.open(path) as image:
+            image.verify()
+    except Exception:
+        raise ValidationError("Upload a valid image.")
+
+
+def link_part(session):
+    """
+    A second name for the finished part file, made with a hard link, so the
+    part file itself stays until the transaction creating the item commits
+    and the last chunk can be sent again if it doesn't. Falls back to the
+    part file itself where hard links are not supported.
+    """
+    path = get_part_path(session)
+    link = '%s.%s.link' % (path, uuid.uuid4().hex)
+    try:
+        os.link(path, link)
+    except OSError:
+        return path
+    return link
+
+
+def move_into_storage(session, item):
+    """
+    Move the finished part file to where the item's FileField would have
+    saved it, without copying it. A content addressed storage reads it once
+    to hash it. Returns the storage name.
+    """
+    field = item._meta.get_field('file')
+    name = field.generate_filename(item, session.filename)
+    storage = field.storage
+    path = link_part(session)
+    if hasattr(storage, 'save_path'):
+        return storage.save_path(name, path)
+    name = storage.get_available_name(name, max_length=field.max_length)
+    target = storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    return name
+
+
+def remove_part(session):
+    try:
+        os.remove(get_part_path(session))
+    except FileNotFoundError:
+        pass
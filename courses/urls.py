@@ -25,6 +25,7 @@ from .views import (
     ContentShowHideView,
     ModuleShowHideView,
     ContentOrderView,
+    ReorderView,
     CourseCreateView,
     CourseEditView,
     ModuleOrderView,
@@ -36,7 +37,8 @@ from .views import (
     FileContentUpdateView,
     VideoContentCreateView,
     VideoContentUpdateView,
-    FileDownloadView
+    FileDownloadView,
+    ImageThumbnailView
 )
 
 app_name = 'courses'
@@ -81,6 +83,7 @@ manage_urls = [
     path('course/update/video/<pk>', VideoContentUpdateView.as_view(), name='update_video'),
 
     path('course/move-content/', ContentOrderView.as_view(), name='move_content'),
+    path('course/reorder/', ReorderView.as_view(), name='reorder'),
     path('course/delete-content/<pk>/', ContentDeleteView.as_view(), name='delete_content'),
     path('course/show-hide-content/<pk>/', ContentShowHideView.as_view(), name='show_hide_content')
 ]
@@ -95,6 +98,7 @@ urlpatterns = [
     path('details/content/image/<pk>', ImageDetailView.as_view(), name='image_detail'),
     path('details/content/file/<pk>', FileDetailView.as_view(), name='file_detail'),
     path('details/content/file/<pk1>/<pk2>/download', FileDownloadView.as_view(), name='file_download'),
+    path('details/content/image/<pk>/thumbnail/<size>', ImageThumbnailView.as_view(), name='image_thumbnail'),
     path('details/content/video/<pk>', VideoDetailView.as_view(), name='video_detail'),
 
     path('manage/', include(manage_urls))
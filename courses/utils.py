@@ -1,8 +1,21 @@
 import os
 import random
 import string
+import time
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.text import slugify
 
+CATEGORY_TREE_VERSION_KEY = 'courses:category_tree:version'
+# The default cache is local to each process, so a bump only reaches the
+# worker that made it. The version expires after this many seconds and is
+# seeded again, which makes every worker rebuild its snapshot at least that
+# often. None keeps it forever with a cache shared by all workers.
+CATEGORY_TREE_VERSION_TIMEOUT = getattr(settings, 'CATEGORY_TREE_VERSION_TIMEOUT', 60)
+# access lists are invalidated only in the worker that changed them, with
+# a per-process cache the others keep a removed member's access this long
+COURSE_ACCESS_TIMEOUT = getattr(settings, 'COURSE_ACCESS_TIMEOUT', 60)
+
 
 def random_string_generator(length=10, chars=string.ascii_lowercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(length))
@@ -36,4 +49,28 @@ def user_index_generator(instance):
 
 
 def get_filename(path):
-    return os.path.basename(path)
\ No newline at end of file
+    return os.path.basename(path)
+
+
+def get_category_tree_version():
+    version = cache.get(CATEGORY_TREE_VERSION_KEY)
+    if version is None:
+        # seeded with the time, so an expired counter never repeats a version
+        cache.add(CATEGORY_TREE_VERSION_KEY, time.time_ns(), CATEGORY_TREE_VERSION_TIMEOUT)
+        version = cache.get(CATEGORY_TREE_VERSION_KEY)
+    return version
+
+
+def bump_category_tree_version():
+    try:
+        cache.incr(CATEGORY_TREE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORY_TREE_VERSION_KEY, time.time_ns(), CATEGORY_TREE_VERSION_TIMEOUT)
+
+
+def course_access_key(user_id):
+    return f'courses:user:{user_id}:access'
+
+
+def invalidate_course_access(user_ids):
+    cache.delete_many([course_access_key(pk) for pk in user_ids if pk is not None])
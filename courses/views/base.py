@@ -1,22 +1,29 @@
-from wsgiref.util import FileWrapper
-from mimetypes import guess_type
+import os
 
 from django.shortcuts import render, get_object_or_404, HttpResponse
 from django.views.generic import ListView, DetailView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import prefetch_related_objects
 from django.http import JsonResponse, Http404
-from ..models import Course, Text, Image, File, Video, Membership, Category, Content
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from ..models import Course, Text, Image, File, Video, Membership, Category, Content, contents_prefetch
 from activity.mixins import CourseViewedMixin
 from ..documents import CourseDocument
 from ..mixins import CachePageMixin
+from ..tree import get_category_tree
+from ..downloads import serve_protected_file, if_range_matches
+from ..thumbnails import THUMBNAIL_SIZES
 
 
 class CourseListView(CachePageMixin, ListView):
-    queryset = Category.objects.all()
     template_name = 'courses/course_list.html'
     context_object_name = "categories"
 
+    def get_queryset(self):
+        return get_category_tree().categories
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['object_list'] = Course.objects.filter(category=None)
@@ -61,13 +68,20 @@ class CourseSearchListView(ListView):
         return context
 
 class CategoryCoursesListView(CachePageMixin, DetailView):
-    queryset = Category.objects.all()
     template_name = 'courses/course_list.html'
 
+    def get_object(self, *args, **kwargs):
+        self.tree = get_category_tree()
+        category = self.tree.get_by_slug(self.kwargs.get('slug'))
+        if category is None:
+            raise Http404("Category doesn't exist")
+        return category
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['object_list'] = self.object.course_set.all()
-        context['categories'] = self.object.child_categories.all()
+        context['categories'] = self.tree.get_children(self.object)
+        context['category_tree'] = self.tree.get_ancestors(self.object)
         return context
 
 
@@ -81,6 +95,19 @@ class CourseDetailView(CourseViewedMixin, DetailView):
         instance = get_object_or_404(Course, slug=slug)
         return instance
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+        is_participant = user.is_authenticated and self.object.participants.filter(pk=user.pk).exists()
+        if is_participant:
+            # contents are listed for participants only
+            prefetch_related_objects([self.object], contents_prefetch(items=False))
+        context['is_participant'] = is_participant
+        tree = get_category_tree()
+        category = tree.get(self.object.category_id)
+        context['category_tree'] = tree.get_ancestors(category) if category else []
+        return context
+
 
 def enroll_course(request):
     course_id = request.POST.get('course_id')
@@ -140,29 +167,98 @@ class VideoDetailView(BaseContentDetailview):
 
 
 class FileDownloadView(LoginRequiredMixin, View):
-    def get(self, *args, **kwargs):
-        content_pk = kwargs.get('pk1')
-        item_pk = kwargs.get('pk2')
-        qs = Content.objects\
+    attachment = True
+
+    def get_content(self):
+        return Content.objects\
             .get_available_queryset(self.request.user)\
-            .filter(pk=content_pk, object_id=item_pk)
-        if not qs.exists():
+            .filter(pk=self.kwargs.get('pk1'), object_id=self.kwargs.get('pk2'), kind__in=['file', 'image'])\
+            .first()
+
+    def get_etag(self, content):
+        # the summary on Content changes with every save of the item
+        if content.updated is None:
+            return None
+        return '"%x-%x-%x"' % (content.object_id, int(content.updated.timestamp() * 1000000), content.size or 0)
+
+    def get_last_modified(self, content):
+        if content.updated is None:
+            return None
+        return int(content.updated.timestamp())
+
+    def get_file(self, content):
+        """Path and download name of the file to send."""
+        item = content.item
+        if not item.file:
+            raise Http404()
+        return item.file.path, item.name
+
+    def get(self, *args, **kwargs):
+        content_obj = self.get_content()
+        if content_obj is None:
             raise Http404("File doesn't exit")
-        
-        content_obj = qs.first()
-        item = content_obj.item
-        if hasattr(item, "file"):
-            filepath = item.file.path
-            with open(filepath, 'rb') as f:
-                wrapper = FileWrapper(f)
-                mimetype = 'application/force-download'
-                guessed_mimetype = guess_type(filepath)[0]
-                if guessed_mimetype:
-                    mimetype = guessed_mimetype
-
-                response = HttpResponse(wrapper, content_type=mimetype)
-                response['Content-Disposition'] = "attachment;filename=%s" % item.name
-                response['X-SendFile'] = str(item.name)
-                return response
-        else:
-            raise Http404()
\ No newline at end of file
+
+        etag = self.get_etag(content_obj)
+        last_modified = self.get_last_modified(content_obj)
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            path, filename = self.get_file(content_obj)
+            use_range = if_range_matches(self.request, etag, last_modified)
+            response = serve_protected_file(
+                self.request, path, filename, use_range=use_range, attachment=self.attachment
+            )
+
+        if etag is not None:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True)
+        return response
+
+
+class ImageThumbnailView(FileDownloadView):
+    """
+    A thumbnail of an image content in WebP when the browser accepts it,
+    in JPEG otherwise. The original is sent until the thumbnails are made.
+    """
+    attachment = False
+
+    def get_content(self):
+        if self.kwargs.get('size') not in THUMBNAIL_SIZES:
+            return None
+        return Content.objects\
+            .get_available_queryset(self.request.user)\
+            .filter(pk=self.kwargs.get('pk'), kind='image')\
+            .first()
+
+    def get_thumbnail(self, content):
+        if not hasattr(self, '_thumbnail'):
+            item = content.item
+            if not item.has_thumbnails():
+                self._thumbnail = None
+            else:
+                storage = item.file.storage
+                accepts_webp = 'image/webp' in self.request.META.get('HTTP_ACCEPT', '')
+                # Pillow of the worker may not have encoded WebP
+                fmt = 'webp' if accepts_webp and 'webp' in item.get_thumbnail_formats() else 'jpeg'
+                name = item.get_thumbnail_name(self.kwargs['size'], fmt)
+                self._thumbnail = (storage.path(name), os.path.basename(name), fmt)
+        return self._thumbnail
+
+    def get_etag(self, content):
+        etag = super().get_etag(content)
+        if etag is None:
+            return None
+        thumbnail = self.get_thumbnail(content)
+        variant = '%s-%s' % (self.kwargs['size'], thumbnail[2]) if thumbnail else 'original'
+        return '%s-%s"' % (etag[:-1], variant)
+
+    def get_file(self, content):
+        thumbnail = self.get_thumbnail(content)
+        if thumbnail is None:
+            return super().get_file(content)
+        return thumbnail[:2]
+
+    def get(self, *args, **kwargs):
+        response = super().get(*args, **kwargs)
+        patch_vary_headers(response, ['Accept'])
+        return response
\ No newline at end of file
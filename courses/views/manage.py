@@ -18,7 +18,7 @@ from django.views.generic import (
 from django.views.generic.detail import SingleObjectMixin
 from django.http import JsonResponse, Http404
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
-from django.db.models import F, Subquery, OuterRef
+from django.db.models import F, Subquery, OuterRef, prefetch_related_objects
 from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse_lazy
 
@@ -48,6 +48,8 @@ from ..mixins import (
     ManageCoursePathMixin,
     ManageCoursesPathMixin,
     ManageCourseContentPathMixin,
+    ManageCourseMixin,
+    CachedObjectMixin,
     CachePageMixin
 )
 from ..models import (
@@ -59,7 +61,8 @@ from ..models import (
     Text,
     Image,
     File,
-    Video
+    Video,
+    contents_prefetch
 )
 
 from activity.models import CourseViewed
@@ -107,12 +110,14 @@ class CourseCreateView(
 
 class CourseEditView(
     ManageCoursePathMixin,
+    ManageCourseMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     UpdateView):
 
     form_class = CourseCreateForm
     template_name = 'courses/edit.html'
+    permission = 'can_edit_course'
 
     def get_paths(self):
         paths = super().get_paths()
@@ -127,26 +132,6 @@ class CourseEditView(
     def get_success_url(self):
         return reverse('courses:manage_list')
 
-    def get_object(self):
-        slug = self.kwargs['slug']
-
-        qs = self.get_queryset()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            return obj.first()
-
-        qs = self.request.user.admin_courses.all()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            obj = obj.first()
-            if obj.can_edit_course(self.request.user):
-                return obj
-        
-        raise Http404()
-        
-    def get_queryset(self):
-        return Course.objects.filter(owner=self.request.user)
-
 
 class DeleteCourseView(
     ManageCoursePathMixin,
@@ -176,6 +161,7 @@ class DeleteCourseView(
 
 class CourseAddContentView(
     ManageCourseContentPathMixin,
+    ManageCourseMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     DetailView):
@@ -183,26 +169,11 @@ class CourseAddContentView(
     model = Course
     template_name = 'courses/add_content.html'
 
-    def get_object(self):
-        slug = self.kwargs['slug']
-        user = self.request.user
-
-        qs = self.get_queryset()
-        obj = qs.filter(slug=slug, owner=user)
-        if obj.exists():
-            return obj.first()
-
-        qs = user.admin_courses.all()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            obj = obj.first()
-            if obj.can_edit_content(user):
-                return obj
-        raise Http404()
-
     def get_context_data(self, **kwargs):
         context = super(CourseAddContentView, self).get_context_data(**kwargs)
-        course = self.get_object()
+        course = self.object
+        # prefetched only once the permissions are checked
+        prefetch_related_objects([course], contents_prefetch())
         context["forms"] = {
             'text': {
                 'instance': TextContentCreateForm(),
@@ -234,6 +205,7 @@ class CourseAddContentView(
 
 class BaseContentCreateView(
     ManageCourseContentPathMixin,
+    ManageCourseMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     FormView):
@@ -244,45 +216,19 @@ class BaseContentCreateView(
         course = self.object.course
         return reverse('courses:course_home', kwargs={'slug': course.slug})
 
-    def get_object(self):
-        return self.get_course()
-
-    def get_course(self):
-        slug = self.kwargs['slug']
-        user = self.request.user
-
-        qs = Course.objects.all()
-        obj = qs.filter(slug=slug, owner=user)
-        if obj.exists():
-            return obj.first()
-
-        qs = user.admin_courses.all()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            obj = obj.first()
-            if obj.can_edit_content(user):
-                return obj
-        raise Http404("Course does not exist")
-
     def get_module(self):
-        course = self.get_course()
-
-        module_pk = self.kwargs.get('pk') or self.request.POST.get('module_id')
-        qs = Module.objects.filter(
-            id=module_pk,
-            course=course
-        )
-
-        if qs.exists():
-            module = qs.first()
-        else:
-            raise Http404("Module does not exist")
-        return module
+        if not hasattr(self, '_module'):
+            module_pk = self.kwargs.get('pk') or self.request.POST.get('module_id')
+            module = Module.objects.filter(id=module_pk, course=self.get_course()).first()
+            if module is None:
+                raise Http404("Module does not exist")
+            self._module = module
+        return self._module
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['module'] = self.get_course()
-        context['course'] = self.get_module()
+        context['course'] = self.get_course()
+        context['module'] = self.get_module()
         return context
 
     def form_valid(self, form):
@@ -391,16 +337,17 @@ class BaseContentUpdateView(
         return Content.objects.filter(
             owner=self.request.user,
             content_type=content_type
-        )
+        ).select_related('course')
 
     def get_object(self):
-        if self.request.is_ajax():
-            content_id = self.request.POST.get('content_id')
-        else:
-            content_id = self.kwargs.get('pk')
+        if not hasattr(self, '_object'):
+            if self.request.is_ajax():
+                content_id = self.request.POST.get('content_id')
+            else:
+                content_id = self.kwargs.get('pk')
 
-        content = get_object_or_404(self.get_queryset(), pk=content_id)
-        return content
+            self._object = get_object_or_404(self.get_queryset(), pk=content_id)
+        return self._object
 
     def get_initial(self):
         initial = super().get_initial()
@@ -485,6 +432,7 @@ class VideoContentUpdateView(BaseContentUpdateView):
 
 class ModuleCreateView(
     ManageCoursePathMixin,
+    ManageCourseMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     FormView):
@@ -500,26 +448,6 @@ class ModuleCreateView(
     def get_success_url(self):
         return reverse('courses:add_content', kwargs={'slug': self.kwargs.get('slug')})
 
-    def get_object(self):
-        return self.get_course()
-
-    def get_course(self):
-        slug = self.kwargs.get('slug')
-        user = self.request.user
-
-        qs = Course.objects.all()
-        obj = qs.filter(slug=slug, owner=user)
-        if obj.exists():
-            return obj.first()
-
-        qs = user.admin_courses.all()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            obj = obj.first()
-            if obj.can_edit_content(user):
-                return obj
-        raise Http404("Course does not exist")
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['course'] = self.get_course()
@@ -540,6 +468,7 @@ class ModuleCreateView(
 
 class ModuleUpdateView(
     ManageCoursesPathMixin,
+    CachedObjectMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     UpdateView):
@@ -564,7 +493,7 @@ class ModuleUpdateView(
         return reverse('courses:add_content', kwargs={'slug': course.slug})
 
     def get_queryset(self):
-        return Module.objects.filter(owner=self.request.user)
+        return Module.objects.filter(owner=self.request.user).select_related('course')
 
     def form_valid(self, form):
         if self.request.is_ajax():
@@ -575,6 +504,7 @@ class ModuleUpdateView(
 
 class ModuleDeleteView(
     ManageCoursesPathMixin,
+    CachedObjectMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     DeleteView):
@@ -598,7 +528,7 @@ class ModuleDeleteView(
         return reverse('courses:add_content', kwargs={'slug': course.slug})
 
     def get_queryset(self):
-        return Module.objects.filter(owner=self.request.user)
+        return Module.objects.filter(owner=self.request.user).select_related('course')
 
     def post(self, request, *args, **kwargs):
         if request.is_ajax():
@@ -631,29 +561,16 @@ class ModuleShowHideView(LoginRequiredMixin, IsTeacherMixin, DetailView):
 class CourseManageDetailView(
     CachePageMixin,
     ManageCoursePathMixin,
+    ManageCourseMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     DetailView):
     template_name = 'courses/course_main.html'
-
-    def get_object(self):
-        slug = self.kwargs.get('slug')
-        user = self.request.user
-
-        qs = Course.objects.all()
-        obj = qs.filter(slug=slug, owner=user)
-        if obj.exists():
-            return obj.first()
-
-        qs = user.admin_courses.all()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            return obj.first()
-        raise Http404("Course does not exist")
+    permission = None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        obj = self.get_object()
+        obj = self.object
         participants = obj.participants.all()
 
         newest = CourseViewed \
@@ -669,11 +586,13 @@ class CourseManageDetailView(
 
 class CourseParticipantsManageDetailView(
     ManageCoursePathMixin,
+    ManageCourseMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     FormView):
     form_class = AddUserToCourseForm
     template_name = 'courses/course_participants.html'
+    permission = 'can_edit_participants'
 
     def get_paths(self):
         paths = super().get_paths()
@@ -683,26 +602,6 @@ class CourseParticipantsManageDetailView(
         ))
         return paths
 
-    def get_object(self):
-        return self.get_course()
-
-    def get_course(self):
-        slug = self.kwargs.get('slug')
-        user = self.request.user
-
-        qs = Course.objects.all()
-        obj = qs.filter(slug=slug, owner=user)
-        if obj.exists():
-            return obj.first()
-
-        qs = user.admin_courses.all()
-        obj = qs.filter(slug=slug)
-        if obj.exists():
-            obj = obj.first()
-            if obj.can_edit_participants(user):
-                return obj
-        raise Http404("Course does not exist")
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         course = self.get_course()
@@ -720,6 +619,7 @@ class CourseParticipantsManageDetailView(
 
 class ContentDeleteView(
     ManageCoursesPathMixin,
+    CachedObjectMixin,
     LoginRequiredMixin, 
     IsTeacherMixin, 
     DeleteView):
@@ -752,7 +652,7 @@ class ContentDeleteView(
         return reverse('courses:add_content', kwargs={'slug': course.slug})
 
     def get_queryset(self):
-        return Content.objects.filter(owner=self.request.user)
+        return Content.objects.filter(owner=self.request.user).select_related('course')
 
     def post(self, request, *args, **kwargs):
         response = self.delete(request, *args, **kwargs)
@@ -839,6 +739,36 @@ class ModuleOrderView(LoginRequiredMixin, IsTeacherMixin, View):
             return HttpResponseRedirect(reverse('courses:course_home', kwargs={'slug': course.slug}))
 
 
+class ReorderView(LoginRequiredMixin, IsTeacherMixin, View):
+    """
+    Applies a complete ordering sent as JSON, either of a module's contents
+    {"module": <id>, "ids": [...]} or of a course's modules
+    {"course": <id>, "ids": [...]}.
+    """
+    http_method_names = ['post']
+
+    def post(self, request, **_):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            ids = [int(pk) for pk in data['ids']]
+            module_id = int(data['module']) if data.get('module') is not None else None
+            course_id = int(data['course']) if data.get('course') is not None else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return JsonResponse({'message': 'Invalid ordering'}, status=400)
+
+        try:
+            if module_id is not None:
+                module = get_object_or_404(Module.objects.select_related('course'), pk=module_id)
+                module.reorder_contents(request.user, ids)
+            elif course_id is not None:
+                get_object_or_404(Course, pk=course_id).reorder_modules(request.user, ids)
+            else:
+                return JsonResponse({'message': 'Invalid ordering'}, status=400)
+        except ValueError as e:
+            return JsonResponse({'message': str(e)}, status=400)
+        return JsonResponse({'message': 'success', 'ids': ids})
+
+
 class CourseAdminsManageDetailView(
     ManageAdminsPathMixin, 
     LoginRequiredMixin, 
@@ -853,8 +783,9 @@ class CourseAdminsManageDetailView(
         return Course.objects.filter(owner=self.request.user)
 
     def get_object(self):
-        course_qs = self.get_queryset()
-        return get_object_or_404(course_qs, slug=self.kwargs['slug'])
+        if not hasattr(self, '_object'):
+            self._object = get_object_or_404(self.get_queryset(), slug=self.kwargs['slug'])
+        return self._object
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
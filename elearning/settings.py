@@ -154,6 +154,11 @@ MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'static_my_proj_cdn', 'medi
 
 PROTECTED_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'static_my_proj_cdn', 'protected')
 
+# how protected files are sent: 'django', or 'nginx' (X-Accel-Redirect to
+# the internal PROTECTED_URL location) and 'apache' (X-Sendfile)
+PROTECTED_FILE_BACKEND = os.getenv('PROTECTED_FILE_BACKEND', 'django')
+PROTECTED_URL = '/protected/'
+
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static_cdn')]
 
 CORS_ALLOWED_ORIGINS = [
@@ -28,7 +28,8 @@ api_urlpatterns = [
     path('content/', include('courses.api.urls.content')),
     path('users/', include('accounts.api.urls.users', 'users')),
     path('auth/', include('accounts.api.urls.auth')),
-    path('news/', include('information.api.urls'))
+    path('news/', include('information.api.urls')),
+    path('calendar/', include('cal.api.urls'))
 ]
 
 urlpatterns = [